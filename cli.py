@@ -3,8 +3,17 @@ import asyncio
 import sys
 from urllib.parse import urlparse
 
-from pipeline.csv_processor import parse_csv, results_to_csv
+from pipeline.csv_processor import open_results_csv, parse_csv_file, with_scheme
 from pipeline.batch_runner import run_batch
+from detector.api_clients import close_clients
+
+
+async def _run_batch_and_close(hotels, **kwargs):
+    """Run the batch, then close the shared API clients on the same loop."""
+    try:
+        return await run_batch(hotels, **kwargs)
+    finally:
+        await close_clients()
 
 
 def main():
@@ -34,6 +43,10 @@ def main():
     parser.add_argument(
         "--screenshots", help="Directory to save booking engine screenshots"
     )
+    parser.add_argument(
+        "--json-cells", action="store_true",
+        help="Write list columns as JSON arrays instead of '; '-joined text",
+    )
 
     args = parser.parse_args()
 
@@ -44,19 +57,15 @@ def main():
         if not url and not city:
             parser.error("Provide --url or --city with --name")
             return
-        if url and not url.startswith(("http://", "https://")):
-            url = f"https://{url}"
+        url = with_scheme(url)
         hotels = [{"name": name, "website": url, "city": city}]
     elif args.url:
-        url = args.url
-        if not url.startswith(("http://", "https://")):
-            url = f"https://{url}"
+        url = with_scheme(args.url)
         name = urlparse(url).netloc.replace("www.", "")
         city = args.city or ""
         hotels = [{"name": name, "website": url, "city": city}]
     elif args.csv_file:
-        with open(args.csv_file, "r") as f:
-            hotels = parse_csv(f.read())
+        hotels = parse_csv_file(args.csv_file)
     else:
         parser.error("Provide a CSV file, --name, or --url")
         return
@@ -74,18 +83,34 @@ def main():
         elif status == "done":
             print(f"  [{index + 1}/{total}] Done: {name}")
 
-    result = asyncio.run(
-        run_batch(
-            hotels,
-            max_concurrent=args.concurrent,
-            screenshot_dir=args.screenshots,
-            on_progress=progress,
-        )
-    )
+    # Rows are written as hotels finish, so an interrupted run keeps what
+    # it has; the summary lines are printed in input order at the end
+    summary: dict[int, str] = {}
+
+    with open(args.output, "w", newline="") as f:
+        write_row = open_results_csv(f, json_cells=args.json_cells)
 
-    csv_output = results_to_csv(result)
-    with open(args.output, "w") as f:
-        f.write(csv_output)
+        def on_result(index, r):
+            write_row(r)
+            f.flush()
+            products = ", ".join(p.value for p in r.duetto_products)
+            status = "DUETTO" if r.duetto_pixel_detected or r.gamechanger_detected else "-"
+            competitors = ", ".join(c.vendor for c in r.competitor_rms) if r.competitor_rms else ""
+            line = f"  {status:8s} | {r.hotel_name} | {products}"
+            if competitors:
+                line += f" | Other: {competitors}"
+            summary[index] = line
+
+        result = asyncio.run(
+            _run_batch_and_close(
+                hotels,
+                max_concurrent=args.concurrent,
+                screenshot_dir=args.screenshots,
+                on_progress=progress,
+                on_result=on_result,
+                keep_results=False,
+            )
+        )
 
     print(f"\n{'=' * 50}")
     print(f"Results saved to {args.output}")
@@ -95,14 +120,8 @@ def main():
     print(f"{'=' * 50}")
 
     # Quick summary table
-    for r in result.results:
-        products = ", ".join(p.value for p in r.duetto_products)
-        status = "DUETTO" if r.duetto_pixel_detected or r.gamechanger_detected else "-"
-        competitors = ", ".join(c.vendor for c in r.competitor_rms) if r.competitor_rms else ""
-        line = f"  {status:8s} | {r.hotel_name} | {products}"
-        if competitors:
-            line += f" | Other: {competitors}"
-        print(line)
+    for index in sorted(summary):
+        print(summary[index])
 
 
 if __name__ == "__main__":
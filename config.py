@@ -3,15 +3,34 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     max_concurrent_scans: int = 3
+    # How many hotel scans may start per second across a job (0 = unpaced)
+    hotels_per_sec: float = 2.0
+    # Per website host, for batches with many properties on one site
+    host_scans_per_sec: float = 1.0
     scan_timeout_ms: int = 30000
     page_load_wait_ms: int = 3000
     booking_engine_wait_ms: int = 8000
+    network_quiet_ms: int = 1500
+    block_noise_requests: bool = True
     max_hotels_per_batch: int = 50
+    csv_read_buffer_bytes: int = 1 << 20
     headless: bool = True
     firecrawl_api_key: str = ""
     anthropic_api_key: str = ""
     perplexity_api_key: str = ""
+    # Client-side limits for the paid APIs, per provider
+    perplexity_rpm: int = 50
+    perplexity_concurrency: int = 4
+    anthropic_rpm: int = 50
+    anthropic_concurrency: int = 4
+    firecrawl_rpm: int = 100
+    firecrawl_concurrency: int = 2
     db_path: str = "data/duetto.db"
+    lookup_cache_path: str = "data/lookup_cache.db"
+    lookup_cache_ttl_days: int = 30
+    # Answers that found nothing are retried sooner
+    lookup_cache_miss_ttl_hours: int = 6
+    lookup_cache_bypass: bool = False
 
     model_config = {"env_prefix": "DUETTO_", "env_file": ".env"}
 
@@ -1,6 +1,7 @@
 """SQLite persistence layer for scan jobs and results."""
 from __future__ import annotations
 
+import asyncio
 import os
 from datetime import datetime, timezone
 
@@ -10,6 +11,13 @@ from config import settings
 
 _db_path: str = ""
 
+# Per-hotel writes go through one writer connection that commits whatever
+# has queued up (at most WRITE_BATCH_SIZE calls) in a single transaction
+WRITE_BATCH_SIZE = 32
+WRITE_QUEUE_SIZE = 1024
+_writer_queue: asyncio.Queue | None = None
+_writer_task: asyncio.Task | None = None
+
 
 async def init_db() -> None:
     """Create tables if they don't exist. Call once at startup."""
@@ -19,6 +27,8 @@ async def init_db() -> None:
 
     async with aiosqlite.connect(_db_path) as conn:
         await conn.executescript("""
+            PRAGMA journal_mode=WAL;
+
             CREATE TABLE IF NOT EXISTS jobs (
                 id TEXT PRIMARY KEY,
                 status TEXT NOT NULL DEFAULT 'pending',
@@ -47,9 +57,99 @@ async def init_db() -> None:
 
             CREATE INDEX IF NOT EXISTS idx_job_hotels_job_id
                 ON job_hotels(job_id);
+
+            CREATE INDEX IF NOT EXISTS idx_job_hotels_job_index
+                ON job_hotels(job_id, hotel_index);
         """)
 
 
+def start_writer() -> None:
+    """Start the background writer if it isn't running."""
+    global _writer_queue, _writer_task
+    if _writer_task is not None and not _writer_task.done():
+        return
+    _writer_queue = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+    _writer_task = asyncio.create_task(_writer_loop(_writer_queue))
+
+
+async def stop_writer() -> None:
+    """Flush queued writes and stop the background writer."""
+    global _writer_task
+    if _writer_task is None:
+        return
+    if not _writer_task.done():
+        await _writer_queue.put(None)
+        await _writer_task
+    _writer_task = None
+
+
+async def _writer_loop(queue: asyncio.Queue) -> None:
+    batch: list = []
+    try:
+        async with aiosqlite.connect(_db_path) as conn:
+            # WAL makes NORMAL safe: a crash can lose the last commit, not corrupt
+            await conn.execute("PRAGMA synchronous=NORMAL")
+            while True:
+                batch = [await queue.get()]
+                while len(batch) < WRITE_BATCH_SIZE and not queue.empty():
+                    batch.append(queue.get_nowait())
+                stop = None in batch
+                batch = [item for item in batch if item is not None]
+                if batch:
+                    await _flush(conn, batch)
+                if stop:
+                    return
+    finally:
+        # Don't leave callers waiting on a writer that has gone away,
+        # including those in a batch cut short by cancellation
+        while not queue.empty():
+            batch.append(queue.get_nowait())
+        for item in batch:
+            if item is not None and not item[1].done():
+                item[1].set_exception(RuntimeError("DB writer stopped"))
+
+
+async def _flush(conn: aiosqlite.Connection, batch: list[tuple]) -> None:
+    # Each caller awaits its own write, so a batch never holds two writes
+    # for one hotel and statements can be grouped for executemany
+    grouped: dict[str, list[tuple]] = {}
+    for statements, _ in batch:
+        for sql, params in statements:
+            grouped.setdefault(sql, []).append(params)
+    try:
+        for sql, rows in grouped.items():
+            await conn.executemany(sql, rows)
+        await conn.commit()
+    except Exception:
+        await conn.rollback()
+        # Replay each caller's writes on their own, so one bad statement
+        # fails only the caller that sent it
+        for statements, future in batch:
+            try:
+                for sql, params in statements:
+                    await conn.execute(sql, params)
+                await conn.commit()
+            except Exception as e:
+                await conn.rollback()
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(None)
+    else:
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+
+async def _write(statements: list[tuple[str, tuple]]) -> None:
+    """Queue statements for the writer and wait until they're committed."""
+    start_writer()
+    future = asyncio.get_running_loop().create_future()
+    await _writer_queue.put((statements, future))
+    await future
+
+
 async def _recover_orphaned_jobs() -> None:
     """Mark jobs stuck in 'running' as 'failed' (e.g. after server restart)."""
     async with aiosqlite.connect(_db_path) as conn:
@@ -101,14 +201,42 @@ async def get_job_hotels(job_id: str) -> list[dict]:
         return [dict(row) for row in await cursor.fetchall()]
 
 
-async def update_hotel_status(job_id: str, hotel_index: int, status: str) -> None:
-    """Set a hotel's status (e.g. 'scanning')."""
+HOTEL_PAGE_SIZE = 200
+
+
+async def get_job_hotels_since(
+    job_id: str, last_index: int, limit: int = HOTEL_PAGE_SIZE
+) -> list[dict]:
+    """Fetch finished hotel rows with index > last_index, ordered by index."""
     async with aiosqlite.connect(_db_path) as conn:
-        await conn.execute(
-            "UPDATE job_hotels SET status = ?, updated_at = ? WHERE job_id = ? AND hotel_index = ?",
-            (status, _now(), job_id, hotel_index),
+        conn.row_factory = aiosqlite.Row
+        cursor = await conn.execute(
+            "SELECT hotel_index, hotel_name, result_json FROM job_hotels"
+            " WHERE job_id = ? AND hotel_index > ? AND status IN ('done', 'error')"
+            " AND result_json IS NOT NULL ORDER BY hotel_index LIMIT ?",
+            (job_id, last_index, limit),
         )
-        await conn.commit()
+        return [dict(row) for row in await cursor.fetchall()]
+
+
+async def get_scanning_hotels(job_id: str) -> list[dict]:
+    """Fetch the hotels currently being scanned for a job."""
+    async with aiosqlite.connect(_db_path) as conn:
+        conn.row_factory = aiosqlite.Row
+        cursor = await conn.execute(
+            "SELECT hotel_index, hotel_name FROM job_hotels"
+            " WHERE job_id = ? AND status = 'scanning'",
+            (job_id,),
+        )
+        return [dict(row) for row in await cursor.fetchall()]
+
+
+async def update_hotel_status(job_id: str, hotel_index: int, status: str) -> None:
+    """Set a hotel's status (e.g. 'scanning')."""
+    await _write([(
+        "UPDATE job_hotels SET status = ?, updated_at = ? WHERE job_id = ? AND hotel_index = ?",
+        (status, _now(), job_id, hotel_index),
+    )])
 
 
 async def save_hotel_result(
@@ -116,12 +244,12 @@ async def save_hotel_result(
 ) -> None:
     """Store a hotel result and update job counters."""
     now = _now()
-    async with aiosqlite.connect(_db_path) as conn:
-        await conn.execute(
+    await _write([
+        (
             "UPDATE job_hotels SET status = 'done', result_json = ?, updated_at = ? WHERE job_id = ? AND hotel_index = ?",
             (result_json, now, job_id, hotel_index),
-        )
-        await conn.execute(
+        ),
+        (
             """UPDATE jobs SET
                 scanned_count = scanned_count + 1,
                 duetto_pixel_count = duetto_pixel_count + ?,
@@ -130,23 +258,23 @@ async def save_hotel_result(
                 updated_at = ?
             WHERE id = ?""",
             (int(is_duetto), int(is_gc), int(has_competitor), now, job_id),
-        )
-        await conn.commit()
+        ),
+    ])
 
 
 async def save_hotel_error(job_id: str, hotel_index: int, error_json: str) -> None:
     """Mark a hotel as errored with its result JSON."""
     now = _now()
-    async with aiosqlite.connect(_db_path) as conn:
-        await conn.execute(
+    await _write([
+        (
             "UPDATE job_hotels SET status = 'error', result_json = ?, updated_at = ? WHERE job_id = ? AND hotel_index = ?",
             (error_json, now, job_id, hotel_index),
-        )
-        await conn.execute(
+        ),
+        (
             "UPDATE jobs SET scanned_count = scanned_count + 1, updated_at = ? WHERE id = ?",
             (now, job_id),
-        )
-        await conn.commit()
+        ),
+    ])
 
 
 async def mark_job_running(job_id: str) -> None:
@@ -10,20 +10,15 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
-from urllib.parse import urlparse
 
 from models import BookingLinkInfo
 from config import settings
+from detector.booking_engine_domains import is_valid_non_ota_url
+from detector.llm_json import loads_json_block
+from detector.rate_limiter import anthropic_limiter
 
 logger = logging.getLogger(__name__)
 
-OTA_DOMAINS = {
-    "booking.com", "expedia.com", "hotels.com", "kayak.com",
-    "tripadvisor.com", "agoda.com", "priceline.com", "trivago.com",
-    "hotwire.com", "orbitz.com", "travelocity.com", "trip.com",
-    "google.com", "momondo.com", "skyscanner.com",
-}
-
 PROMPT = """What is the direct booking URL for the hotel "{hotel_name}" in {city}?
 
 I need the URL of the hotel's own booking engine or reservation page where
@@ -40,55 +35,28 @@ If you don't know: {{"url": "", "confidence": "none"}}"""
 
 def _query_haiku(hotel_name: str, city: str) -> dict:
     """Synchronous Haiku call (run via asyncio.to_thread)."""
-    from anthropic import Anthropic
-
-    client = Anthropic(api_key=settings.anthropic_api_key)
-    message = client.messages.create(
-        model="claude-haiku-4-5-20251001",
-        max_tokens=256,
-        messages=[{
-            "role": "user",
-            "content": PROMPT.format(hotel_name=hotel_name, city=city),
-        }],
-    )
+    from detector.api_clients import get_anthropic
+
+    client = get_anthropic()
+    with anthropic_limiter.track():
+        message = client.messages.create(
+            model="claude-haiku-4-5-20251001",
+            max_tokens=256,
+            messages=[{
+                "role": "user",
+                "content": PROMPT.format(hotel_name=hotel_name, city=city),
+            }],
+        )
 
     text = message.content[0].text.strip()
-    # Handle code fences
-    if "```" in text:
-        for part in text.split("```"):
-            part = part.strip()
-            if part.startswith("json"):
-                part = part[4:].strip()
-            if part.startswith("{"):
-                text = part
-                break
 
     try:
-        return json.loads(text)
+        return loads_json_block(text)
     except json.JSONDecodeError:
         logger.warning("AI booking query: invalid JSON: %s", text[:200])
         return {}
 
 
-def _validate_url(url: str) -> bool:
-    """Check that URL is valid and not an OTA."""
-    if not url or not url.startswith(("http://", "https://")):
-        return False
-    try:
-        parsed = urlparse(url)
-        if not parsed.netloc:
-            return False
-        base = parsed.netloc.lower().lstrip("www.")
-        parts = base.split(".")
-        if len(parts) >= 2:
-            registrable = ".".join(parts[-2:])
-            if registrable in OTA_DOMAINS:
-                return False
-        return True
-    except Exception:
-        return False
-
-
 async def find_booking_link_via_ai(
     hotel_name: str, city: str
 ) -> list[BookingLinkInfo]:
@@ -105,7 +73,7 @@ async def find_booking_link_via_ai(
     url = data.get("url", "").strip()
     confidence = data.get("confidence", "none")
 
-    if not _validate_url(url):
+    if not is_valid_non_ota_url(url):
         logger.info("AI booking query: no valid URL for %s in %s", hotel_name, city)
         return []
 
@@ -0,0 +1,61 @@
+"""Shared API clients for the booking-link lookups and fallbacks.
+
+Each client is built on first use and reused afterwards, so repeat calls
+keep their HTTP connection pools instead of reconnecting every time. The
+async clients are bound to the running event loop; close_clients() shuts
+them down on app exit (or at the end of a CLI run).
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+
+from config import settings
+
+
+@lru_cache(maxsize=1)
+def get_firecrawl():
+    """Return the shared Firecrawl client."""
+    from firecrawl import Firecrawl
+
+    return Firecrawl(api_key=settings.firecrawl_api_key)
+
+
+@lru_cache(maxsize=1)
+def get_anthropic():
+    """Return the shared Anthropic client."""
+    from anthropic import Anthropic
+
+    return Anthropic(api_key=settings.anthropic_api_key)
+
+
+@lru_cache(maxsize=1)
+def get_async_anthropic():
+    """Return the shared async Anthropic client (10 s request timeout)."""
+    from anthropic import AsyncAnthropic
+
+    return AsyncAnthropic(api_key=settings.anthropic_api_key, timeout=10.0)
+
+
+@lru_cache(maxsize=1)
+def get_http_client():
+    """Return the shared httpx.AsyncClient (HTTP/2, pooled keep-alive)."""
+    import httpx
+
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=15,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+    )
+
+
+async def close_clients() -> None:
+    """Close the shared Anthropic and HTTP clients, if they were created."""
+    if get_http_client.cache_info().currsize:
+        await get_http_client().aclose()
+        get_http_client.cache_clear()
+    if get_async_anthropic.cache_info().currsize:
+        await get_async_anthropic().close()
+        get_async_anthropic.cache_clear()
+    if get_anthropic.cache_info().currsize:
+        get_anthropic().close()
+        get_anthropic.cache_clear()
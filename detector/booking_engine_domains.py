@@ -1,7 +1,7 @@
 """Shared registry of known booking engine domains and chain patterns."""
 from __future__ import annotations
 
-from urllib.parse import urlparse
+from functools import lru_cache
 
 # Domains / substrings that indicate a booking engine URL.
 KNOWN_BOOKING_ENGINE_DOMAINS: list[str] = [
@@ -56,6 +56,16 @@ BOOKING_URL_KEYWORDS: list[str] = [
 ]
 
 
+# Online travel agencies and aggregators — never a hotel's own booking engine
+OTA_DOMAINS = frozenset({
+    "booking.com", "expedia.com", "hotels.com", "kayak.com",
+    "tripadvisor.com", "agoda.com", "priceline.com", "trivago.com",
+    "hotwire.com", "orbitz.com", "travelocity.com", "trip.com",
+    "momondo.com", "skyscanner.com", "cheaptickets.com", "lastminute.com",
+    "hostelworld.com", "google.com",
+})
+
+
 def url_matches_booking_engine(url: str) -> bool:
     """Return True if *url* contains any known booking engine domain or keyword."""
     url_lower = url.lower()
@@ -65,6 +75,34 @@ def url_matches_booking_engine(url: str) -> bool:
     )
 
 
+def url_netloc(url: str) -> str:
+    """Return the netloc of an absolute URL ("" if it has none).
+
+    Plain string scanning: this runs over every captured request and
+    candidate URL, and urlsplit's full parse is wasted on just the host.
+    """
+    start = url.find("://")
+    # The "://" must follow the scheme (not sit inside a data: or blob: URL)
+    if start < 0 or url.find(":") != start:
+        return ""
+    start += 3
+    end = len(url)
+    for ch in "/?#":
+        i = url.find(ch, start, end)
+        if i >= 0:
+            end = i
+    return url[start:end]
+
+
+def registrable_domain(host: str) -> str:
+    """Return the last two labels of a lowercase host ("a.b.com" → "b.com")."""
+    last = host.rfind(".")
+    if last <= 0:
+        return host
+    return host[host.rfind(".", 0, last) + 1:]
+
+
+@lru_cache(maxsize=4096)
 def extract_base_domain(url_or_host: str) -> str:
     """Extract the registrable domain from a URL or hostname.
 
@@ -72,11 +110,17 @@ def extract_base_domain(url_or_host: str) -> str:
     "https://www.marriott.com/foo"  → "marriott.com"
     """
     if "://" in url_or_host:
-        host = urlparse(url_or_host).netloc
+        host = url_netloc(url_or_host)
     else:
         host = url_or_host
-    host = host.lower().lstrip("www.")
-    parts = host.split(".")
-    if len(parts) >= 2:
-        return ".".join(parts[-2:])
-    return host
+    return registrable_domain(host.lower().removeprefix("www."))
+
+
+def is_valid_non_ota_url(url: str) -> bool:
+    """Check that URL is an absolute http(s) URL and not an OTA."""
+    if not url or not url.startswith(("http://", "https://")):
+        return False
+    host = url_netloc(url).lower().removeprefix("www.")
+    if not host:
+        return False
+    return registrable_domain(host) not in OTA_DOMAINS
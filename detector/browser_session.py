@@ -1,15 +1,202 @@
 from __future__ import annotations
 
-from playwright.async_api import async_playwright, Browser, BrowserContext
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+from playwright.async_api import async_playwright, Browser, BrowserContext, Route
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Pure ad/analytics beacons that never carry a Duetto signal. Tag managers
+# are deliberately absent — the Duetto pixel is often deployed through one.
+BLOCKED_HOST_SUFFIXES = frozenset({
+    "doubleclick.net", "google-analytics.com", "googlesyndication.com",
+    "googleadservices.com", "adservice.google.com", "facebook.net",
+    "connect.facebook.com", "hotjar.com", "mixpanel.com", "segment.io",
+    "clarity.ms", "bat.bing.com", "analytics.tiktok.com", "snap.licdn.com",
+    "ads.linkedin.com", "criteo.com", "taboola.com", "outbrain.com",
+    "adnxs.com", "pinimg.com", "quantserve.com", "scorecardresearch.com",
+})
+
+# Heavy resource types that detection never needs
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "media", "font"})
+
+# Always let these through, whatever their resource type
+ALLOWED_HOST_SUFFIXES = ("duettoresearch.com", "duettocloud.com")
+
+
+def _host_matches(host: str, suffixes) -> bool:
+    """Return True if host is one of suffixes or a subdomain of one."""
+    return any(host == s or host.endswith("." + s) for s in suffixes)
+
+
+def _make_route_filter(block_media: bool):
+    """Build a route handler that aborts ad/analytics beacons and, when
+    *block_media* is set, heavy media requests; everything else continues.
+
+    Aborted requests still raise the context's "request" event, so
+    NetworkMonitor records their URLs as before.
+    """
+
+    async def route_filter(route: Route) -> None:
+        request = route.request
+        host = urlsplit(request.url).hostname or ""
+        blocked = not _host_matches(host, ALLOWED_HOST_SUFFIXES) and (
+            (block_media and request.resource_type in BLOCKED_RESOURCE_TYPES)
+            or _host_matches(host, BLOCKED_HOST_SUFFIXES)
+        )
+        try:
+            if blocked:
+                await route.abort()
+            else:
+                await route.continue_()
+        except Exception:
+            pass
+
+    return route_filter
+
+
+@dataclass
+class _PooledContext:
+    context: BrowserContext
+    created_at: float = field(default_factory=time.monotonic)
+    uses: int = 0
+    # Origins that loaded a document in this context since the last reset
+    origins: set[str] = field(default_factory=set)
+
+    def __post_init__(self):
+        self.context.on("request", self._note_origin)
+
+    def _note_origin(self, request) -> None:
+        if request.resource_type == "document":
+            parts = urlsplit(request.url)
+            if parts.scheme in ("http", "https") and parts.netloc:
+                self.origins.add(f"{parts.scheme}://{parts.netloc}")
+
+
+class BrowserContextPool:
+    """Bounded pool of reusable browser contexts.
+
+    Contexts are reset (pages closed, cookies and permissions cleared, and
+    localStorage, IndexedDB, service workers and cache storage wiped for
+    every origin the scan visited) when released, then handed to the next
+    scan instead of being recreated. A context is closed rather than reused
+    once it has served *max_uses* scans or is older than *max_age_seconds*,
+    so renderer memory doesn't build up indefinitely.
+    """
+
+    def __init__(
+        self,
+        session: BrowserSession,
+        max_size: int,
+        max_uses: int = 20,
+        max_age_seconds: float = 600.0,
+    ):
+        self._session = session
+        self._semaphore = asyncio.Semaphore(max_size)
+        self._idle: asyncio.Queue[_PooledContext] = asyncio.Queue()
+        self._in_use: dict[BrowserContext, _PooledContext] = {}
+        self.max_uses = max_uses
+        self.max_age_seconds = max_age_seconds
+
+    async def acquire(self) -> BrowserContext:
+        """Return an idle context, creating one if the pool is not full."""
+        await self._semaphore.acquire()
+        try:
+            entry = self._idle.get_nowait()
+        except asyncio.QueueEmpty:
+            try:
+                entry = _PooledContext(await self._session.new_context())
+            except BaseException:
+                self._semaphore.release()
+                raise
+        entry.uses += 1
+        self._in_use[entry.context] = entry
+        return entry.context
+
+    async def release(self, context: BrowserContext) -> None:
+        """Reset a context and return it to the pool, or close it if it is
+        worn out or the reset fails."""
+        entry = self._in_use.pop(context)
+        try:
+            expired = (
+                entry.uses >= self.max_uses
+                or time.monotonic() - entry.created_at > self.max_age_seconds
+            )
+            if expired:
+                await self._close_quietly(context)
+                return
+            try:
+                for page in list(context.pages):
+                    await page.close()
+                await self._clear_origin_storage(entry)
+                await context.clear_cookies()
+                await context.clear_permissions()
+            except Exception:
+                await self._close_quietly(context)
+            else:
+                self._idle.put_nowait(entry)
+        finally:
+            self._semaphore.release()
+
+    @staticmethod
+    async def _clear_origin_storage(entry: _PooledContext) -> None:
+        """Wipe per-origin storage the next scan must not see.
+
+        Cookies and permissions are context-wide and cleared separately;
+        everything else is keyed by origin and needs a CDP call per origin.
+        """
+        if not entry.origins:
+            return
+        page = await entry.context.new_page()
+        try:
+            cdp = await entry.context.new_cdp_session(page)
+            for origin in entry.origins:
+                await cdp.send("Storage.clearDataForOrigin", {
+                    "origin": origin,
+                    "storageTypes": "local_storage,indexeddb,websql,"
+                                    "service_workers,cache_storage,file_systems",
+                })
+            await cdp.detach()
+        finally:
+            await page.close()
+        entry.origins.clear()
+
+    async def close(self) -> None:
+        """Close all idle contexts."""
+        while not self._idle.empty():
+            await self._close_quietly(self._idle.get_nowait().context)
+
+    @staticmethod
+    async def _close_quietly(context: BrowserContext) -> None:
+        try:
+            await context.close()
+        except Exception:
+            pass
 
 
 class BrowserSession:
     """Manages Playwright browser lifecycle."""
 
-    def __init__(self, headless: bool = True):
+    def __init__(
+        self,
+        headless: bool = True,
+        max_contexts: int = 3,
+        block_media: bool = True,
+    ):
         self.headless = headless
+        self.max_contexts = max_contexts
+        # Off when screenshots are taken, so they show the page as rendered
+        self.block_media = block_media
         self._playwright = None
         self._browser: Browser | None = None
+        self.context_pool: BrowserContextPool | None = None
 
     async def __aenter__(self):
         self._playwright = await async_playwright().start()
@@ -26,9 +213,20 @@ class BrowserSession:
                 "--disable-features=IsolateOrigins,site-per-process",
             ],
         )
+        # One context per CPU at most, never more than the scan concurrency
+        pool_size = max(1, min(os.cpu_count() or 1, self.max_contexts))
+        if pool_size < self.max_contexts:
+            logger.info(
+                "Browser context pool capped at %d (cpu_count) below the "
+                "requested %d; extra scans will wait for a free context",
+                pool_size, self.max_contexts,
+            )
+        self.context_pool = BrowserContextPool(self, pool_size)
         return self
 
     async def __aexit__(self, *args):
+        if self.context_pool:
+            await self.context_pool.close()
         if self._browser:
             await self._browser.close()
         if self._playwright:
@@ -36,7 +234,7 @@ class BrowserSession:
 
     async def new_context(self) -> BrowserContext:
         """Create a new browser context with realistic settings."""
-        return await self._browser.new_context(
+        context = await self._browser.new_context(
             viewport={"width": 1280, "height": 800},
             user_agent=(
                 "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -46,3 +244,6 @@ class BrowserSession:
             locale="en-US",
             timezone_id="America/New_York",
         )
+        if settings.block_noise_requests:
+            await context.route("**/*", _make_route_filter(self.block_media))
+        return context
@@ -6,8 +6,10 @@ page loads or API calls — pure pattern matching on already-captured data.
 """
 from __future__ import annotations
 
+import asyncio
 import logging
-from urllib.parse import urlparse
+from typing import Awaitable
+from urllib.parse import urlsplit
 
 from playwright.async_api import Page
 from detector.network_monitor import NetworkMonitor
@@ -149,15 +151,15 @@ def _check_network(monitor: NetworkMonitor) -> dict[str, list[str]]:
     """
     hits: dict[str, list[str]] = {}
     for req in monitor.all_requests:
-        url_lower = req["url"].lower()
+        url_lower = req.url.lower()
         try:
-            host = urlparse(req["url"]).netloc.lower()
+            host = urlsplit(req.url).netloc.lower()
         except Exception:
             host = ""
         for vendor, info in VENDOR_PATTERNS.items():
             for domain in info["domains"]:
                 if domain in host or domain in url_lower:
-                    hits.setdefault(vendor, []).append(req["url"])
+                    hits.setdefault(vendor, []).append(req.url)
                     break
     return hits
 
@@ -216,13 +218,16 @@ async def _check_dom(page: Page) -> dict[str, list[str]]:
     return hits
 
 
-async def _check_cookies(page: Page) -> dict[str, list[str]]:
+async def _check_cookies(
+    page: Page, cookies: Awaitable[list[dict]] | None = None
+) -> dict[str, list[str]]:
     """Check cookies for vendor-specific patterns.
 
+    *cookies* lets the caller share one in-flight context.cookies() fetch.
     Returns {vendor_name: [cookie_descriptions, ...]}.
     """
     try:
-        cookies = await page.context.cookies()
+        cookies = await (cookies if cookies is not None else page.context.cookies())
     except Exception:
         return {}
 
@@ -244,18 +249,23 @@ async def _check_cookies(page: Page) -> dict[str, list[str]]:
 async def detect_competitor_rms(
     monitor: NetworkMonitor,
     page: Page,
+    cookies: Awaitable[list[dict]] | None = None,
 ) -> list:
     """Detect competitor RMS/tech vendors from captured data.
 
+    Pass *cookies* (e.g. a task wrapping page.context.cookies()) to reuse
+    a fetch the caller already started.
+
     Returns list of CompetitorRMSDetection (imported lazily to avoid
     circular imports at module level).
     """
     from models import CompetitorRMSDetection
 
-    # Run all three checks
+    # Run all three checks; the two browser round-trips overlap
     network_hits = _check_network(monitor)
-    dom_hits = await _check_dom(page)
-    cookie_hits = await _check_cookies(page)
+    dom_hits, cookie_hits = await asyncio.gather(
+        _check_dom(page), _check_cookies(page, cookies)
+    )
 
     # Merge all evidence per vendor
     all_vendors = set(network_hits) | set(dom_hits) | set(cookie_hits)
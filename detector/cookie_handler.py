@@ -39,8 +39,21 @@ CONSENT_SELECTORS = [
 ]
 
 
+# All consent selectors as one CSS selector list, for a single presence check
+CONSENT_UNION_SELECTOR = ", ".join(f"{s}:visible" for s in CONSENT_SELECTORS)
+
+
 async def dismiss_cookie_consent(page: Page, timeout_ms: int = 3000) -> bool:
     """Attempt to dismiss a cookie consent banner. Returns True if successful."""
+    # One query for the whole set; most pages have no banner to click
+    try:
+        if await page.locator(CONSENT_UNION_SELECTOR).count() == 0:
+            return False
+    except Exception:
+        pass
+
+    # Walk the list in priority order so CMP-specific buttons win over
+    # generic text matches
     for selector in CONSENT_SELECTORS:
         try:
             locator = page.locator(selector).first
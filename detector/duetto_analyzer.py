@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
+import re
 import time
+from bisect import bisect_right
+from dataclasses import dataclass
 from datetime import date, timedelta
-from urllib.parse import urlparse, urlencode, parse_qs, urlunparse
+from functools import lru_cache
+from urllib.parse import urlencode, urlsplit, urlunsplit
 from playwright.async_api import Page, BrowserContext
 
 from models import DuettoDetectionResult, DuettoProduct, BookingLinkInfo
@@ -18,108 +24,192 @@ from detector.browser_session import BrowserSession
 
 logger = logging.getLogger(__name__)
 
+# Runs of characters replaced with a single "_" in screenshot file names
+_SLUG_RE = re.compile(r"[^A-Za-z0-9]+")
 
-def _inject_dates_into_url(url: str) -> str:
-    """Add default check-in/check-out dates to a booking engine URL.
+# Query keys that already carry a stay date (generic-engine check)
+_DATE_PARAM_NAMES = frozenset({
+    "arrive", "depart", "checkin", "checkout",
+    "check_in", "check_out", "datein", "dateout",
+    "startdate", "enddate", "arrivaldate", "departuredate",
+    "start_date", "end_date", "arrival", "departure",
+})
 
-    The Duetto pixel typically only fires when the booking engine displays
-    room rates, which requires dates to be present in the URL.
+
+@dataclass(frozen=True)
+class EngineRule:
+    """Date query params a booking engine expects, keyed by host tokens.
+
+    Param templates use {ci}/{co} for ISO dates and {ci_slash}/{co_slash}
+    for MM/DD/YYYY.
     """
-    if not url or not url.startswith("http"):
-        return url
 
-    parsed = urlparse(url)
-    params = parse_qs(parsed.query)
-    host = parsed.netloc.lower()
+    tokens: tuple[str, ...]
+    params: dict[str, str]
 
-    checkin = (date.today() + timedelta(days=14)).strftime("%Y-%m-%d")
-    checkout = (date.today() + timedelta(days=15)).strftime("%Y-%m-%d")
-    checkin_slash = (date.today() + timedelta(days=14)).strftime("%m/%d/%Y")
-    checkout_slash = (date.today() + timedelta(days=15)).strftime("%m/%d/%Y")
+    def render(self, dates: tuple[str, str, str, str]) -> list[tuple[str, str]]:
+        """Fill the param templates with (checkin, checkout, *_slash) dates."""
+        ci, co, ci_slash, co_slash = dates
+        return [
+            (key, value.format(ci=ci, co=co, ci_slash=ci_slash, co_slash=co_slash))
+            for key, value in self.params.items()
+        ]
 
-    # Detect booking engine type and add appropriate date params
-    url_lower = url.lower()
 
+# When a host matches several rules the earliest one wins.
+BOOKING_ENGINES: list[EngineRule] = [
     # SynXis (Sabre) — arrive/depart
-    if "synxis" in host or "synxis" in url_lower:
-        params.setdefault("arrive", [checkin])
-        params.setdefault("depart", [checkout])
-        params.setdefault("adult", ["2"])
-        params.setdefault("rooms", ["1"])
-
+    EngineRule(("synxis",), {"arrive": "{ci}", "depart": "{co}", "adult": "2", "rooms": "1"}),
     # TravelClick / Amadeus — datein/dateout
-    elif "travelclick" in host or "travelclick" in url_lower:
-        params.setdefault("datein", [checkin_slash])
-        params.setdefault("dateout", [checkout_slash])
-        params.setdefault("adults", ["2"])
-
+    EngineRule(("travelclick",), {"datein": "{ci_slash}", "dateout": "{co_slash}", "adults": "2"}),
     # Generic reservations subdomains (often TravelClick-based)
-    elif "reservations." in host:
-        params.setdefault("datein", [checkin_slash])
-        params.setdefault("dateout", [checkout_slash])
-        params.setdefault("adults", ["2"])
-
+    EngineRule(("reservations",), {"datein": "{ci_slash}", "dateout": "{co_slash}", "adults": "2"}),
     # SiteMinder / Little Hotelier
-    elif "siteminder" in host or "littlehotelier" in host:
-        params.setdefault("checkin", [checkin])
-        params.setdefault("checkout", [checkout])
-
+    EngineRule(("siteminder", "littlehotelier"), {"checkin": "{ci}", "checkout": "{co}"}),
     # Cloudbeds
-    elif "cloudbeds" in host:
-        params.setdefault("checkin", [checkin])
-        params.setdefault("checkout", [checkout])
-
+    EngineRule(("cloudbeds",), {"checkin": "{ci}", "checkout": "{co}"}),
     # BookAssist
-    elif "bookassist" in host:
-        params.setdefault("arrive", [checkin])
-        params.setdefault("depart", [checkout])
-
+    EngineRule(("bookassist",), {"arrive": "{ci}", "depart": "{co}"}),
     # Profitroom
-    elif "profitroom" in host:
-        params.setdefault("dateFrom", [checkin])
-        params.setdefault("dateTo", [checkout])
-
+    EngineRule(("profitroom",), {"dateFrom": "{ci}", "dateTo": "{co}"}),
     # Mews
-    elif "mews" in host:
-        params.setdefault("startDate", [checkin])
-        params.setdefault("endDate", [checkout])
-
+    EngineRule(("mews",), {"startDate": "{ci}", "endDate": "{co}"}),
     # D-EDGE
-    elif "d-edge" in host or "availpro" in host:
-        params.setdefault("arrivalDate", [checkin])
-        params.setdefault("departureDate", [checkout])
-
+    EngineRule(("d-edge", "availpro"), {"arrivalDate": "{ci}", "departureDate": "{co}"}),
     # Roiback
-    elif "rfrb" in host or "roiback" in host:
-        params.setdefault("checkin", [checkin])
-        params.setdefault("checkout", [checkout])
-
+    EngineRule(("rfrb", "roiback"), {"checkin": "{ci}", "checkout": "{co}"}),
     # Mirai
-    elif "mirai" in host:
-        params.setdefault("checkin", [checkin])
-        params.setdefault("checkout", [checkout])
-
-    # Generic fallback — try common param names
-    else:
-        has_dates = any(
-            k.lower() in (
-                "arrive", "depart", "checkin", "checkout",
-                "check_in", "check_out", "datein", "dateout",
-                "startdate", "enddate", "arrivaldate", "departuredate",
-                "start_date", "end_date", "arrival", "departure",
-            )
-            for k in params
+    EngineRule(("mirai",), {"checkin": "{ci}", "checkout": "{co}"}),
+]
+
+# Generic fallback for unknown engines without any date params
+GENERIC_ENGINE = EngineRule((), {"checkin": "{ci}", "checkout": "{co}", "adults": "2"})
+
+# host token → index into BOOKING_ENGINES
+_ENGINE_BY_TOKEN: dict[str, int] = {
+    token: i for i, rule in enumerate(BOOKING_ENGINES) for token in rule.tokens
+}
+
+# Engines that may also be identified from the URL path, not just the host
+_URL_HINT_ENGINES = ("synxis", "travelclick")
+
+
+def _host_tokens(host: str) -> list[str]:
+    """Split a host into dot labels plus their dash-separated parts."""
+    tokens = []
+    for label in host.split("."):
+        tokens.append(label)
+        if "-" in label:
+            tokens.extend(label.split("-"))
+    return tokens
+
+
+@lru_cache(maxsize=1024)
+def _classify_engine(host: str, url_hint: str) -> EngineRule | None:
+    """Return the booking engine rule for a host, or None if unknown.
+
+    Pure and cached, so hotels sharing an engine classify it once per run.
+    """
+    best = _ENGINE_BY_TOKEN.get(url_hint)
+    for token in _host_tokens(host):
+        idx = _ENGINE_BY_TOKEN.get(token)
+        if idx is not None and (best is None or idx < best):
+            best = idx
+    return BOOKING_ENGINES[best] if best is not None else None
+
+
+# (today ordinal, checkin, checkout, checkin_slash, checkout_slash)
+_DATE_CACHE: tuple[int, str, str, str, str] | None = None
+
+
+def _get_default_dates() -> tuple[str, str, str, str]:
+    """Return (checkin, checkout, checkin_slash, checkout_slash) for a stay
+    two weeks out, formatted at most once per day per process."""
+    global _DATE_CACHE
+    today = date.today()
+    ordinal = today.toordinal()
+    if _DATE_CACHE is None or _DATE_CACHE[0] != ordinal:
+        checkin = today + timedelta(days=14)
+        checkout = today + timedelta(days=15)
+        _DATE_CACHE = (
+            ordinal,
+            checkin.strftime("%Y-%m-%d"),
+            checkout.strftime("%Y-%m-%d"),
+            checkin.strftime("%m/%d/%Y"),
+            checkout.strftime("%m/%d/%Y"),
         )
-        if not has_dates:
-            params.setdefault("checkin", [checkin])
-            params.setdefault("checkout", [checkout])
-            params.setdefault("adults", ["2"])
+    return _DATE_CACHE[1:]
+
+
+def _inject_dates_into_url(url: str) -> str:
+    """Add default check-in/check-out dates to a booking engine URL.
+
+    The Duetto pixel typically only fires when the booking engine displays
+    room rates, which requires dates to be present in the URL.
+    """
+    if not url or not url.startswith("http"):
+        return url
+
+    parsed = urlsplit(url)
+    host = parsed.hostname or ""
+
+    # Keys that already carry a value; blank ones (e.g. "arrive=") get filled
+    segments = [seg for seg in parsed.query.split("&") if seg]
+    present = {
+        key.lower()
+        for key, sep, value in (seg.partition("=") for seg in segments)
+        if sep and value
+    }
+
+    # Detect booking engine type and add appropriate date params. Engines are
+    # matched on the (already lowercase) hostname; the start of the path is
+    # also checked for engines proxied under the hotel's own domain.
+    path_head = parsed.path[:32].lower()
+    url_hint = next((e for e in _URL_HINT_ENGINES if e in path_head), "")
+    has_dates = not present.isdisjoint(_DATE_PARAM_NAMES)
+
+    rule = _classify_engine(host, url_hint)
+    if rule is None:
+        if has_dates:
+            return url
+        rule = GENERIC_ENGINE
+
+    additions = [
+        (key, value)
+        for key, value in rule.render(_get_default_dates())
+        if key.lower() not in present
+    ]
+    if not additions:
+        return url
+
+    # Append only the missing params, dropping blank placeholders for them
+    added = {key.lower() for key, _ in additions}
+    kept = [seg for seg in segments if seg.partition("=")[0].lower() not in added]
+    kept.append(urlencode(additions))
+    return urlunsplit(parsed._replace(query="&".join(kept)))
+
 
-    # Rebuild URL
-    flat_params = {k: v[0] if isinstance(v, list) else v for k, v in params.items()}
-    new_query = urlencode(flat_params)
-    new_parsed = parsed._replace(query=new_query)
-    return urlunparse(new_parsed)
+@dataclass
+class _SharedScan:
+    """A running scan and how many callers are still awaiting it."""
+
+    task: asyncio.Task
+    callers: int = 0
+
+    async def join(self) -> DuettoDetectionResult:
+        """Await the scan; the last caller to give up cancels it."""
+        self.callers += 1
+        try:
+            return await asyncio.shield(self.task)
+        finally:
+            self.callers -= 1
+            if self.callers == 0 and not self.task.done():
+                self.task.cancel()
+
+
+# In-flight scans keyed by browser session, hotel and screenshot dir, so
+# concurrent duplicate requests on the same browser share one run
+_inflight: dict[tuple, _SharedScan] = {}
 
 
 async def analyze_hotel(
@@ -135,7 +225,45 @@ async def analyze_hotel(
       Phase 1: Official website (homepage)
       Phase 2: Booking engine landing page (no dates)
       Phase 3: Booking engine with dates injected
+
+    A scan already running for the same hotel on the same browser session
+    is awaited rather than repeated; the caller gets its own copy of the
+    result. Cancelling one caller leaves the scan running for the others,
+    and the scan is cancelled once no caller is left. A waiter whose shared
+    scan was cancelled runs its own.
     """
+    key = (id(browser_session), hotel_name, website_url, city, screenshot_dir)
+    shared = _inflight.get(key)
+    if shared is not None:
+        try:
+            result = await shared.join()
+        except asyncio.CancelledError:
+            if not shared.task.cancelled():
+                raise  # this caller was cancelled, not the shared scan
+        else:
+            return result.model_copy(deep=True)
+
+    task = asyncio.ensure_future(_analyze_hotel(
+        hotel_name, website_url, browser_session, screenshot_dir, city,
+    ))
+    shared = _inflight[key] = _SharedScan(task)
+
+    def _forget(done: asyncio.Task) -> None:
+        entry = _inflight.get(key)
+        if entry is not None and entry.task is done:
+            del _inflight[key]
+
+    task.add_done_callback(_forget)
+    return await shared.join()
+
+
+async def _analyze_hotel(
+    hotel_name: str,
+    website_url: str,
+    browser_session: BrowserSession,
+    screenshot_dir: str | None,
+    city: str,
+) -> DuettoDetectionResult:
     start_time = time.time()
 
     # Step 0: Use Perplexity to find URLs if needed
@@ -169,20 +297,18 @@ async def analyze_hotel(
         website_url=website_url,
     )
 
-    context = await browser_session.new_context()
+    context = await browser_session.context_pool.acquire()
     monitor = NetworkMonitor()
 
+    # One context-level subscription covers every page and popup
+    monitor.attach_context(context)
+
     try:
         page = await context.new_page()
-        monitor.attach(page)
-
-        # Monitor any new pages/popups that open
-        context.on("page", lambda new_page: monitor.attach(new_page))
 
         # ── Phase 1: Official Website ──────────────────────────────────
         logger.info("[%s] Phase 1: Official website %s", hotel_name, website_url)
-        if await _navigate_safe(page, website_url):
-            await dismiss_cookie_consent(page)
+        if await _navigate_safe(page, website_url, monitor):
             result.pages_analyzed.append(page.url)
             await _detect_on_page(page, monitor, result)
 
@@ -200,7 +326,7 @@ async def analyze_hotel(
                         booking_url = best.href
                     else:
                         # No full URL — click-based navigation
-                        await _follow_booking_link(page, context, best, monitor)
+                        await _follow_booking_link(page, context, monitor, best)
                         active = await _get_active_page(context, page)
                         booking_url = active.url
         else:
@@ -218,10 +344,8 @@ async def analyze_hotel(
             )
 
             booking_page = await context.new_page()
-            monitor.attach(booking_page)
 
-            if await _navigate_safe(booking_page, booking_url):
-                await dismiss_cookie_consent(booking_page)
+            if await _navigate_safe(booking_page, booking_url, monitor):
                 result.pages_analyzed.append(booking_page.url)
                 await _detect_on_page(booking_page, monitor, result)
 
@@ -229,12 +353,25 @@ async def analyze_hotel(
                 dated_url = _inject_dates_into_url(booking_url)
                 logger.info("[%s] Phase 3: Booking with dates %s", hotel_name, dated_url)
 
-                if await _navigate_safe(booking_page, dated_url):
-                    await dismiss_cookie_consent(booking_page)
-                    await _try_trigger_rate_search(booking_page)
-                    await booking_page.wait_for_timeout(settings.booking_engine_wait_ms)
+                if await _navigate_safe(booking_page, dated_url, monitor):
+                    # Skip the button hunt once the pixel fired, and stop
+                    # the settle wait as soon as it does or the network
+                    # goes quiet
+                    if not monitor.duetto_pixel_detected:
+                        await _try_trigger_rate_search(booking_page, monitor)
+                    await monitor.wait_until_settled(
+                        booking_page,
+                        settings.booking_engine_wait_ms,
+                        settings.network_quiet_ms,
+                    )
                     result.pages_analyzed.append(booking_page.url)
-                    await _detect_on_page(booking_page, monitor, result)
+                    # Final page: the screenshot overlaps the DOM checks
+                    await asyncio.gather(
+                        _detect_on_page(booking_page, monitor, result),
+                        _take_screenshot(
+                            context, page, hotel_name, screenshot_dir, result
+                        ),
+                    )
 
                 result.booking_engine_url = booking_page.url
             else:
@@ -262,15 +399,9 @@ async def analyze_hotel(
                 )
 
         # Console logs with direct Duetto references (not CSP violations)
-        duetto_console = [
-            log for log in monitor.console_logs
-            if "duetto" in log.lower()
-            and "content security policy" not in log.lower()
-            and "violates" not in log.lower()
-        ]
-        if duetto_console:
+        if monitor.duetto_console_logs:
             result.gamechanger_evidence.extend(
-                [f"console: {log}" for log in duetto_console[:5]]
+                [f"console: {log}" for log in monitor.duetto_console_logs]
             )
 
         # Build product list
@@ -283,14 +414,14 @@ async def analyze_hotel(
 
         result.confidence = _calculate_confidence(result)
         result.all_captured_domains = monitor.captured_domains
-        result.console_logs = monitor.console_logs[:50]
+        result.console_logs = list(monitor.console_logs)
 
         # Collect proof snippets
         proof: list[str] = []
         for pr in result.pixel_requests:
             proof.append(f"pixel_request: {pr.url}")
         for csp in monitor.csp_headers:
-            if any(p in csp.lower() for p in NetworkMonitor.DUETTO_DOMAIN_PATTERNS):
+            if NetworkMonitor.DUETTO_DOMAIN_RE.search(csp):
                 snippet = csp[:500] + "..." if len(csp) > 500 else csp
                 proof.append(f"csp_header: {snippet}")
         for ev in result.gamechanger_evidence:
@@ -298,82 +429,166 @@ async def analyze_hotel(
                 proof.append(ev)
         result.proof_snippets = proof
 
-        # Optional screenshot (take on the last active page)
-        if screenshot_dir:
-            slug = "".join(
-                c if c.isalnum() else "_" for c in hotel_name
-            ).strip("_")
-            screenshot_path = f"{screenshot_dir}/{slug}_booking.png"
-            try:
-                active = await _get_active_page(context, page)
-                await active.screenshot(path=screenshot_path)
-                result.screenshot_path = screenshot_path
-            except Exception:
-                pass
+        # Optional screenshot, unless Phase 3 already took it
+        if not result.screenshot_path:
+            await _take_screenshot(
+                context, page, hotel_name, screenshot_dir, result
+            )
 
     except Exception as e:
         result.errors.append(f"Scan error: {e}")
     finally:
-        await context.close()
+        monitor.detach_context(context)
+        await browser_session.context_pool.release(context)
         result.scan_duration_seconds = round(time.time() - start_time, 1)
 
     return result
 
 
-async def _navigate_safe(page: Page, url: str) -> bool:
-    """Navigate to a URL with fallback. Returns True on success."""
+# Cap on waiting for the load event once the DOM is ready
+LOAD_EVENT_TIMEOUT_MS = 5000
+
+
+async def _navigate_safe(
+    page: Page, url: str, monitor: NetworkMonitor
+) -> bool:
+    """Navigate to a URL, dismiss any cookie banner, and let the page settle.
+
+    Returns False only if the navigation never commits. Later load stages
+    are waited for but never fail the call, so a page with a hung resource
+    costs at most one timeout. The page then gets a short, bounded
+    quiet-network wait (not Playwright's networkidle, which analytics
+    beacons can keep out of reach) alongside cookie dismissal.
+    """
     try:
         await page.goto(
             url,
-            wait_until="networkidle",
+            wait_until="commit",
             timeout=settings.scan_timeout_ms,
         )
-        await page.wait_for_timeout(settings.page_load_wait_ms)
-        return True
     except Exception:
+        return False
+
+    for state, timeout in (
+        ("domcontentloaded", settings.scan_timeout_ms),
+        ("load", LOAD_EVENT_TIMEOUT_MS),
+    ):
         try:
-            await page.goto(
-                url,
-                wait_until="domcontentloaded",
-                timeout=settings.scan_timeout_ms,
-            )
-            await page.wait_for_timeout(settings.page_load_wait_ms)
-            return True
+            await page.wait_for_load_state(state, timeout=timeout)
         except Exception:
-            return False
+            break
+
+    _, dismissed = await asyncio.gather(
+        _wait_quiet(monitor, page),
+        dismiss_cookie_consent(page),
+        return_exceptions=True,
+    )
+    await monitor.wait_for_duetto(settings.page_load_wait_ms)
+
+    # Banners injected after the load event get a second chance
+    if dismissed is not True:
+        await dismiss_cookie_consent(page)
+    return True
+
+
+async def _wait_quiet(
+    monitor: NetworkMonitor,
+    page: Page,
+    quiet_ms: int = 800,
+    max_ms: int = 5000,
+) -> bool:
+    """Wait until *page* has had no request in flight for *quiet_ms*, capped at *max_ms*.
+
+    Returns True if the network went quiet before the cap.
+    """
+    deadline = time.monotonic() + max_ms / 1000
+    quiet = quiet_ms / 1000
+    quiet_since = None
+    while time.monotonic() < deadline and not page.is_closed():
+        if monitor.in_flight_count(page) == 0:
+            now = time.monotonic()
+            if quiet_since is None:
+                quiet_since = now
+            elif now - quiet_since >= quiet:
+                return True
+        else:
+            quiet_since = None
+        await asyncio.sleep(0.1)
+    return False
 
 
 async def _detect_on_page(
     page: Page, monitor: NetworkMonitor, result: DuettoDetectionResult
 ) -> None:
     """Run DOM-level detection on the current page and accumulate into result."""
+    from detector.competitor_rms import detect_competitor_rms
+
+    # Pixel and GameChanger both already proven by network traffic: the
+    # Duetto DOM/cookie probes can add nothing, so only look for competitors
+    if monitor.duetto_pixel_detected and (
+        result.gamechanger_detected or monitor.gamechanger_in_network
+    ):
+        try:
+            new_competitors = await detect_competitor_rms(monitor, page)
+        except Exception:
+            return
+        _merge_competitors(result, new_competitors)
+        return
+
+    # The probes are independent CDP round-trips — overlap them. Cookies
+    # are fetched once and shared with the competitor RMS check.
+    cookies_task = asyncio.ensure_future(page.context.cookies())
+    dom_signals, source_evidence, cookies, new_competitors = await asyncio.gather(
+        page.evaluate(_GAMECHANGER_DOM_JS),
+        page.evaluate(_DUETTO_SOURCE_JS),
+        cookies_task,
+        detect_competitor_rms(monitor, page, cookies=cookies_task),
+        return_exceptions=True,
+    )
+
     # GameChanger DOM inspection
-    try:
-        gc_evidence = await _check_gamechanger_dom(page)
-        if gc_evidence:
-            result.gamechanger_detected = True
-            result.gamechanger_evidence.extend(gc_evidence)
-    except Exception:
-        pass
+    gc_evidence: list[str] = []
+    if not isinstance(dom_signals, BaseException) and dom_signals:
+        gc_evidence.extend(dom_signals)
+    if not isinstance(cookies, BaseException):
+        gc_evidence.extend(_duetto_cookie_evidence(cookies))
+    if gc_evidence:
+        result.gamechanger_detected = True
+        result.gamechanger_evidence.extend(gc_evidence)
 
     # Check page source / __INITIAL_STATE__ for Duetto references
-    try:
-        source_evidence = await _check_duetto_in_source(page)
-        if source_evidence:
-            result.gamechanger_evidence.extend(source_evidence)
-    except Exception:
-        pass
+    if not isinstance(source_evidence, BaseException) and source_evidence:
+        result.gamechanger_evidence.extend(source_evidence)
+
+    if not isinstance(new_competitors, BaseException):
+        _merge_competitors(result, new_competitors)
+
+
+def _merge_competitors(result: DuettoDetectionResult, new_competitors) -> None:
+    """Add competitor RMS detections, deduplicated by vendor name."""
+    existing_vendors = {c.vendor for c in result.competitor_rms}
+    for comp in new_competitors:
+        if comp.vendor not in existing_vendors:
+            result.competitor_rms.append(comp)
+            existing_vendors.add(comp.vendor)
 
-    # Competitor RMS detection
+
+async def _take_screenshot(
+    context: BrowserContext,
+    page: Page,
+    hotel_name: str,
+    screenshot_dir: str | None,
+    result: DuettoDetectionResult,
+) -> None:
+    """Screenshot the last active page into screenshot_dir, if one is set."""
+    if not screenshot_dir:
+        return
+    slug = _SLUG_RE.sub("_", hotel_name).strip("_")
+    screenshot_path = f"{screenshot_dir}/{slug}_booking.png"
     try:
-        from detector.competitor_rms import detect_competitor_rms
-        new_competitors = await detect_competitor_rms(monitor, page)
-        # Deduplicate by vendor name
-        existing_vendors = {c.vendor for c in result.competitor_rms}
-        for comp in new_competitors:
-            if comp.vendor not in existing_vendors:
-                result.competitor_rms.append(comp)
-                existing_vendors.add(comp.vendor)
+        active = await _get_active_page(context, page)
+        await active.screenshot(path=screenshot_path)
+        result.screenshot_path = screenshot_path
     except Exception:
         pass
 
@@ -386,32 +601,41 @@ async def _get_active_page(context: BrowserContext, fallback: Page) -> Page:
     return fallback
 
 
+async def _wait_for_url_change(page: Page, url_before: str, timeout_ms: int):
+    """Wait up to *timeout_ms* for the page to start navigating elsewhere."""
+    try:
+        await page.wait_for_url(
+            lambda url: url != url_before, wait_until="commit", timeout=timeout_ms
+        )
+    except Exception:
+        pass
+
+
 async def _follow_booking_link(
     page: Page,
     context: BrowserContext,
-    link: BookingLinkInfo,
     monitor: NetworkMonitor,
+    link: BookingLinkInfo,
 ):
     """Follow a booking link, handling new tabs, popups, iframes, and modals."""
 
     if link.opens_in == "iframe":
-        await page.wait_for_timeout(3000)
+        await monitor.wait_for_duetto(3000)
         return
 
     # For links with full URLs, navigate directly
     if link.href and link.href.startswith("http"):
         if link.opens_in == "new_tab":
             new_page = await context.new_page()
-            monitor.attach(new_page)
             try:
                 await new_page.goto(
                     link.href,
                     wait_until="domcontentloaded",
                     timeout=30000,
                 )
-                await new_page.wait_for_timeout(5000)
             except Exception:
-                await new_page.wait_for_timeout(5000)
+                pass
+            await monitor.wait_for_duetto(5000)
             return
 
         try:
@@ -420,9 +644,9 @@ async def _follow_booking_link(
                 wait_until="domcontentloaded",
                 timeout=30000,
             )
-            await page.wait_for_timeout(3000)
+            await monitor.wait_for_duetto(3000)
         except Exception:
-            await page.wait_for_timeout(5000)
+            await monitor.wait_for_duetto(5000)
         return
 
     # No direct URL — the button likely opens a modal or triggers JS
@@ -432,13 +656,14 @@ async def _follow_booking_link(
     except Exception:
         return
 
-    await page.wait_for_timeout(2000)
+    await _wait_for_url_change(page, url_before, 2000)
 
     if page.url != url_before:
         try:
-            await page.wait_for_load_state("networkidle", timeout=15000)
+            await page.wait_for_load_state("load", timeout=15000)
         except Exception:
             pass
+        await _wait_quiet(monitor, page)
         return
 
     submitted = await _try_submit_modal_booking_form(page, context, monitor)
@@ -450,60 +675,68 @@ async def _follow_booking_link(
             async with context.expect_page(timeout=10000) as new_page_info:
                 await _click_booking_element(page, link)
             new_page = await new_page_info.value
-            monitor.attach(new_page)
             try:
-                await new_page.wait_for_load_state(
-                    "networkidle", timeout=30000
-                )
+                await new_page.wait_for_load_state("load", timeout=30000)
             except Exception:
-                await new_page.wait_for_timeout(5000)
+                pass
+            await _wait_quiet(monitor, new_page)
         except Exception:
             pass
 
 
+DATE_INPUT_SELECTOR = ", ".join(
+    f'input[name="{name}"]'
+    for name in (
+        "arrive", "depart", "checkin", "checkout", "datein", "dateout",
+        "check_in", "check_out", "arrivalDate", "departureDate",
+        "startDate", "endDate",
+    )
+)
+CHECKIN_NAME_KEYS = ["arrive", "checkin", "check_in", "datein", "arrival", "start"]
+CHECKOUT_NAME_KEYS = ["depart", "checkout", "check_out", "dateout", "departure", "end"]
+
+# Selector and name keywords are baked in at import; only the dates are
+# sent with each evaluate call
+_FILL_DATE_INPUTS_JS = """([checkin, checkout]) => {
+    var ciKeys = __CI_KEYS__;
+    var coKeys = __CO_KEYS__;
+    function matches(name, keys) {
+        return keys.some(function(k) { return name.indexOf(k) !== -1; });
+    }
+    var filled = false;
+    document.querySelectorAll(__SELECTOR__).forEach(function(el) {
+        var name = (el.name || '').toLowerCase();
+        var val = null;
+        if (matches(name, ciKeys)) val = checkin;
+        else if (matches(name, coKeys)) val = checkout;
+        if (val === null) return;
+        el.value = val;
+        el.dispatchEvent(new Event('input', {bubbles: true}));
+        filled = true;
+    });
+    return filled;
+}""".replace("__CI_KEYS__", json.dumps(CHECKIN_NAME_KEYS)).replace(
+    "__CO_KEYS__", json.dumps(CHECKOUT_NAME_KEYS)
+).replace("__SELECTOR__", json.dumps(DATE_INPUT_SELECTOR))
+
+
 async def _try_submit_modal_booking_form(
     page: Page,
     context: BrowserContext,
     monitor: NetworkMonitor,
 ) -> bool:
     """Try to fill in dates and submit a modal booking form."""
-    checkin = (date.today() + timedelta(days=14)).strftime("%Y-%m-%d")
-    checkout = (date.today() + timedelta(days=15)).strftime("%Y-%m-%d")
+    checkin, checkout, _, _ = _get_default_dates()
 
     await _select_first_property(page)
 
-    date_input_selectors = [
-        'input[name="arrive"]',
-        'input[name="depart"]',
-        'input[name="checkin"]',
-        'input[name="checkout"]',
-        'input[name="datein"]',
-        'input[name="dateout"]',
-        'input[name="check_in"]',
-        'input[name="check_out"]',
-        'input[name="arrivalDate"]',
-        'input[name="departureDate"]',
-        'input[name="startDate"]',
-        'input[name="endDate"]',
-    ]
-
-    filled_dates = False
-    for selector in date_input_selectors:
-        try:
-            inputs = page.locator(selector)
-            count = await inputs.count()
-            if count > 0:
-                for i in range(count):
-                    el = inputs.nth(i)
-                    name = (await el.get_attribute("name") or "").lower()
-                    if any(k in name for k in ("arrive", "checkin", "check_in", "datein", "arrival", "start")):
-                        await el.evaluate("(el, val) => el.value = val", checkin)
-                        filled_dates = True
-                    elif any(k in name for k in ("depart", "checkout", "check_out", "dateout", "departure", "end")):
-                        await el.evaluate("(el, val) => el.value = val", checkout)
-                        filled_dates = True
-        except Exception:
-            continue
+    # Fill every matching date input in a single round-trip
+    try:
+        filled_dates = await page.evaluate(
+            _FILL_DATE_INPUTS_JS, [checkin, checkout]
+        )
+    except Exception:
+        filled_dates = False
 
     if not filled_dates:
         return False
@@ -532,65 +765,62 @@ async def _try_submit_modal_booking_form(
     if form_url:
         form_url = _inject_dates_into_url(form_url)
         new_page = await context.new_page()
-        monitor.attach(new_page)
         try:
             await new_page.goto(
                 form_url, wait_until="domcontentloaded", timeout=30000
             )
         except Exception:
             pass
-        await new_page.wait_for_timeout(5000)
+        await monitor.wait_for_duetto(5000)
         return True
 
-    submit_selectors = [
-        'button:has-text("Book Now"):visible',
-        'button:has-text("Search"):visible',
-        'button:has-text("Check Availability"):visible',
-        'button:has-text("Find Rooms"):visible',
-        'button[type="submit"]:visible',
-        'input[type="submit"]:visible',
-    ]
+    # Locate the first visible submit button in one round-trip, then click
+    # it in-page while watching for a new tab
+    try:
+        index = await page.evaluate(
+            _MODAL_SUBMIT_JS, [0, False]
+        )
+    except Exception:
+        return False
+    if index < 0:
+        return False
 
     url_before = page.url
-    for selector in submit_selectors:
+    try:
+        async with context.expect_page(timeout=10000) as new_page_info:
+            await page.evaluate(
+                _MODAL_SUBMIT_JS, [index, True]
+            )
+        new_page = await new_page_info.value
         try:
-            locator = page.locator(selector).first
-            if await locator.is_visible(timeout=1000):
-                try:
-                    async with context.expect_page(timeout=10000) as new_page_info:
-                        await locator.click(timeout=3000)
-                    new_page = await new_page_info.value
-                    monitor.attach(new_page)
-                    try:
-                        await new_page.wait_for_load_state(
-                            "domcontentloaded", timeout=30000
-                        )
-                    except Exception:
-                        pass
-                    await new_page.wait_for_timeout(5000)
-                    return True
-                except Exception:
-                    await page.wait_for_timeout(3000)
-                    if page.url != url_before:
-                        try:
-                            await page.wait_for_load_state(
-                                "domcontentloaded", timeout=15000
-                            )
-                        except Exception:
-                            pass
-                        return True
+            await new_page.wait_for_load_state(
+                "domcontentloaded", timeout=30000
+            )
         except Exception:
-            continue
+            pass
+        await monitor.wait_for_duetto(5000)
+        return True
+    except Exception:
+        await _wait_for_url_change(page, url_before, 3000)
+        if page.url != url_before:
+            try:
+                await page.wait_for_load_state(
+                    "domcontentloaded", timeout=15000
+                )
+            except Exception:
+                pass
+            return True
 
     return False
 
 
+PROPERTY_SELECT_KEYWORDS = [
+    "location", "hotel", "property", "destination", "resort",
+]
+
+
 async def _select_first_property(page: Page):
     """Select the first non-empty option in a property/destination dropdown."""
-    property_select_keywords = [
-        "location", "hotel", "property", "destination", "resort",
-    ]
-
     selected = await page.evaluate("""(keywords) => {
         var selects = document.querySelectorAll('select');
         for (var i = 0; i < selects.length; i++) {
@@ -611,164 +841,225 @@ async def _select_first_property(page: Page):
             return nonEmpty[0];
         }
         return null;
-    }""", property_select_keywords)
+    }""", PROPERTY_SELECT_KEYWORDS)
 
     if selected:
         await page.wait_for_timeout(1000)
 
 
 async def _click_booking_element(page: Page, link: BookingLinkInfo):
-    """Click a booking element by reconstructing the best selector."""
-    if link.href and link.link_type == "link":
+    """Click a booking element, trying the most specific locator first.
+
+    Role + accessible name comes first, then the exact href, then a text
+    filter on the tag; each early tier fails fast so a miss costs little.
+    The last resort is a page-wide text match, which raises if it fails.
+    Text is passed to Playwright as a parameter, never spliced into a
+    selector string.
+    """
+    text = link.text.split("\n")[0].strip()
+    is_link = link.link_type == "link"
+    href_css = None
+    if link.href and is_link:
+        href_css = '[href="{}"]'.format(link.href.replace('"', '\\"'))
+
+    tiers = []
+    if text:
+        by_role = page.get_by_role("link" if is_link else "button", name=text)
+        if href_css:
+            by_role = by_role.and_(page.locator(href_css))
+        tiers.append(by_role)
+    if href_css:
+        tiers.append(page.locator(f"a{href_css}"))
+    if text:
+        tag = "button" if link.link_type == "button" else "a"
+        tiers.append(page.locator(tag).filter(has_text=text))
+
+    for locator in tiers:
         try:
-            safe_href = link.href.replace('"', '\\"')
-            locator = page.locator(f'a[href="{safe_href}"]').first
-            if await locator.is_visible(timeout=3000):
-                await locator.click()
-                return
+            await locator.first.click(timeout=1500)
+            return
         except Exception:
             pass
 
-    tag = "button" if link.link_type == "button" else "a"
-    text = link.text.split("\n")[0].strip().replace('"', '\\"')
-    try:
-        locator = page.locator(f'{tag}:has-text("{text}")').first
-        await locator.click(timeout=5000)
-    except Exception:
-        locator = page.locator(f':has-text("{text}")').first
-        await locator.click(timeout=5000)
-
-
-async def _try_trigger_rate_search(page: Page):
-    """Try to trigger a room/rate search on the booking engine page."""
-    search_selectors = [
-        'button:has-text("Search")',
-        'button:has-text("Check Availability")',
-        'button:has-text("Find Rooms")',
-        'button:has-text("View Rates")',
-        'button:has-text("Check Rates")',
-        'button:has-text("Submit")',
-        'button:has-text("Buscar")',
-        'button:has-text("Suchen")',
-        'button:has-text("Rechercher")',
-        'input[type="submit"]',
-        'button[type="submit"]',
-        '#submitButton',
-        '.search-button',
-        '.btn-search',
-    ]
+    if not text:
+        raise LookupError(f"No clickable element found for {link.href!r}")
+    await page.get_by_text(text).first.click(timeout=5000)
+
+
+# (css, has-text) pairs for rate-search buttons, in priority order
+RATE_SEARCH_CANDIDATES: list[tuple[str, str | None]] = [
+    ("button", "Search"),
+    ("button", "Check Availability"),
+    ("button", "Find Rooms"),
+    ("button", "View Rates"),
+    ("button", "Check Rates"),
+    ("button", "Submit"),
+    ("button", "Buscar"),
+    ("button", "Suchen"),
+    ("button", "Rechercher"),
+    ('input[type="submit"]', None),
+    ('button[type="submit"]', None),
+    ("#submitButton", None),
+    (".search-button", None),
+    (".btn-search", None),
+]
+
+# (css, has-text) pairs for modal booking form submit buttons
+MODAL_SUBMIT_CANDIDATES: list[tuple[str, str | None]] = [
+    ("button", "Book Now"),
+    ("button", "Search"),
+    ("button", "Check Availability"),
+    ("button", "Find Rooms"),
+    ('button[type="submit"]', None),
+    ('input[type="submit"]', None),
+]
+
+def _click_first_visible_js(candidates: list[tuple[str, str | None]]) -> str:
+    """Build an in-page function over fixed (css, text) candidates.
+
+    The function takes [start, click] and returns the index of the first
+    visible candidate at or after *start*, or -1. It clicks that element
+    in-page when *click* is true.
+    """
+    return """([start, click]) => {
+    var candidates = __CANDIDATES__;
+    function visible(el) {
+        if (!el.getClientRects().length) return false;
+        return getComputedStyle(el).visibility !== 'hidden';
+    }
+    for (var i = start; i < candidates.length; i++) {
+        var css = candidates[i][0];
+        var text = candidates[i][1];
+        var els = document.querySelectorAll(css);
+        for (var j = 0; j < els.length; j++) {
+            var el = els[j];
+            if (text) {
+                var content = (el.textContent || '').replace(/\\s+/g, ' ').toLowerCase();
+                if (content.indexOf(text.toLowerCase()) === -1) continue;
+            }
+            if (visible(el)) {
+                if (click) el.click();
+                return i;
+            }
+        }
+    }
+    return -1;
+}""".replace("__CANDIDATES__", json.dumps(candidates))
 
-    for selector in search_selectors:
-        try:
-            locator = page.locator(selector).first
-            if await locator.is_visible(timeout=1000):
-                await locator.click(timeout=3000)
-                await page.wait_for_timeout(3000)
-                return
-        except Exception:
-            continue
 
+_RATE_SEARCH_JS = _click_first_visible_js(RATE_SEARCH_CANDIDATES)
+_MODAL_SUBMIT_JS = _click_first_visible_js(MODAL_SUBMIT_CANDIDATES)
 
-async def _check_gamechanger_dom(page: Page) -> list[str]:
-    """Check the page DOM for GameChanger-related signals."""
-    evidence = []
 
-    duetto_signals = await page.evaluate("""
-        () => {
-            const signals = [];
-            for (const key of Object.keys(window)) {
-                const lower = key.toLowerCase();
-                if (lower.includes('duetto') || lower.includes('gamechanger')) {
-                    signals.push('window.' + key);
-                }
+async def _try_trigger_rate_search(page: Page, monitor: NetworkMonitor):
+    """Try to trigger a room/rate search on the booking engine page."""
+    # One round-trip finds and clicks the first visible candidate instead
+    # of probing each selector with its own is_visible() timeout
+    try:
+        index = await page.evaluate(
+            _RATE_SEARCH_JS, [0, True]
+        )
+    except Exception:
+        return
+    if index >= 0:
+        await monitor.wait_for_duetto(3000)
+
+
+_GAMECHANGER_DOM_JS = """
+    () => {
+        const RX = /duetto|gamechanger/i;
+        const DUETTO_RX = /duetto/i;
+        const MAX_SIGNALS = 32;
+        const signals = [];
+        // Own property names include non-enumerable globals
+        for (const key of Object.getOwnPropertyNames(window)) {
+            if (RX.test(key)) {
+                signals.push('window.' + key);
+                if (signals.length >= MAX_SIGNALS) return signals;
             }
-            document.querySelectorAll('script[src]').forEach(s => {
-                if (s.src.toLowerCase().includes('duetto')) {
-                    signals.push('script: ' + s.src);
-                }
-            });
-            document.querySelectorAll('meta').forEach(m => {
-                const content = (m.content || '').toLowerCase();
-                const name = (m.name || '').toLowerCase();
-                if (content.includes('duetto') || name.includes('duetto') ||
-                    content.includes('gamechanger') || name.includes('gamechanger')) {
-                    signals.push('meta[' + m.name + ']: ' + m.content);
+        }
+        for (const el of document.querySelectorAll('script[src],meta')) {
+            if (el.tagName === 'SCRIPT') {
+                if (DUETTO_RX.test(el.src)) {
+                    signals.push('script: ' + el.src);
                 }
-            });
-            if (document.title.toLowerCase().includes('gamechanger')) {
-                signals.push('title: ' + document.title);
+            } else if (RX.test(el.content || '') || RX.test(el.name || '')) {
+                signals.push('meta[' + el.name + ']: ' + el.content);
             }
-            return signals;
+            if (signals.length >= MAX_SIGNALS) return signals;
         }
-    """)
-
-    if duetto_signals:
-        evidence.extend(duetto_signals)
-
-    try:
-        cookies = await page.context.cookies()
-        for cookie in cookies:
-            name_lower = cookie["name"].lower()
-            domain_lower = cookie.get("domain", "").lower()
-            if "duetto" in name_lower or "duetto" in domain_lower:
-                evidence.append(
-                    f"cookie: {cookie['name']} (domain: {cookie.get('domain', '')})"
-                )
-    except Exception:
-        pass
-
-    return evidence
-
-
-async def _check_duetto_in_source(page: Page) -> list[str]:
-    """Check the page HTML source and app state for Duetto references."""
-    return await page.evaluate("""
-        (function() {
-            var evidence = [];
-            var patterns = ["duettoresearch", "duettocloud"];
-
-            if (window.__INITIAL_STATE__) {
-                var stateStr = JSON.stringify(window.__INITIAL_STATE__);
-                var lower = stateStr.toLowerCase();
-                for (var p = 0; p < patterns.length; p++) {
-                    var idx = lower.indexOf(patterns[p]);
-                    var found = 0;
-                    while (idx !== -1 && found < 3) {
-                        var start = Math.max(0, idx - 50);
-                        var end = Math.min(stateStr.length, idx + patterns[p].length + 50);
-                        evidence.push("__INITIAL_STATE__: ..." + stateStr.substring(start, end) + "...");
-                        found++;
-                        idx = lower.indexOf(patterns[p], idx + 1);
-                    }
+        if (/gamechanger/i.test(document.title)) {
+            signals.push('title: ' + document.title);
+        }
+        return signals;
+    }
+"""
+
+_DUETTO_SOURCE_JS = """
+    (function() {
+        var evidence = [];
+        var patterns = ["duettoresearch", "duettocloud"];
+
+        if (window.__INITIAL_STATE__) {
+            var stateStr = JSON.stringify(window.__INITIAL_STATE__);
+            var lower = stateStr.toLowerCase();
+            for (var p = 0; p < patterns.length; p++) {
+                var idx = lower.indexOf(patterns[p]);
+                var found = 0;
+                while (idx !== -1 && found < 3) {
+                    var start = Math.max(0, idx - 50);
+                    var end = Math.min(stateStr.length, idx + patterns[p].length + 50);
+                    evidence.push("__INITIAL_STATE__: ..." + stateStr.substring(start, end) + "...");
+                    found++;
+                    idx = lower.indexOf(patterns[p], idx + 1);
                 }
             }
+        }
 
-            var scripts = document.querySelectorAll("script:not([src])");
-            for (var i = 0; i < scripts.length; i++) {
-                var text = scripts[i].textContent || "";
-                var textLower = text.toLowerCase();
-                for (var p2 = 0; p2 < patterns.length; p2++) {
-                    var idx2 = textLower.indexOf(patterns[p2]);
-                    if (idx2 !== -1) {
-                        var start2 = Math.max(0, idx2 - 80);
-                        var end2 = Math.min(text.length, idx2 + patterns[p2].length + 80);
-                        evidence.push("inline_script: ..." + text.substring(start2, end2).trim() + "...");
-                    }
+        var scripts = document.querySelectorAll("script:not([src])");
+        for (var i = 0; i < scripts.length; i++) {
+            var text = scripts[i].textContent || "";
+            var textLower = text.toLowerCase();
+            for (var p2 = 0; p2 < patterns.length; p2++) {
+                var idx2 = textLower.indexOf(patterns[p2]);
+                if (idx2 !== -1) {
+                    var start2 = Math.max(0, idx2 - 80);
+                    var end2 = Math.min(text.length, idx2 + patterns[p2].length + 80);
+                    evidence.push("inline_script: ..." + text.substring(start2, end2).trim() + "...");
                 }
             }
+        }
 
-            var metas = document.querySelectorAll("meta[http-equiv]");
-            for (var j = 0; j < metas.length; j++) {
-                var content = metas[j].content || "";
-                if (content.toLowerCase().indexOf("duettoresearch") !== -1) {
-                    var snippet = content.length > 500 ? content.substring(0, 500) + "..." : content;
-                    evidence.push("meta_csp: " + snippet);
-                }
+        var metas = document.querySelectorAll("meta[http-equiv]");
+        for (var j = 0; j < metas.length; j++) {
+            var content = metas[j].content || "";
+            if (content.toLowerCase().indexOf("duettoresearch") !== -1) {
+                var snippet = content.length > 500 ? content.substring(0, 500) + "..." : content;
+                evidence.push("meta_csp: " + snippet);
             }
+        }
+
+        return evidence;
+    })()
+"""
 
-            return evidence;
-        })()
-    """)
+
+def _duetto_cookie_evidence(cookies: list[dict]) -> list[str]:
+    """Return evidence strings for cookies whose name or domain mention Duetto."""
+    evidence = []
+    for cookie in cookies:
+        name_lower = cookie["name"].lower()
+        domain_lower = cookie.get("domain", "").lower()
+        if "duetto" in name_lower or "duetto" in domain_lower:
+            evidence.append(
+                f"cookie: {cookie['name']} (domain: {cookie.get('domain', '')})"
+            )
+    return evidence
+
+
+_CONFIDENCE_LEVELS = ("none", "low", "medium", "high")
+# Minimum score for low / medium / high
+_CONFIDENCE_THRESHOLDS = (1, 2, 4)
 
 
 def _calculate_confidence(result: DuettoDetectionResult) -> str:
@@ -777,26 +1068,15 @@ def _calculate_confidence(result: DuettoDetectionResult) -> str:
         "CSP allowlist" in e for e in result.errors
     )
 
-    score = 0
-
-    if result.duetto_pixel_detected:
-        score += 1 if csp_only else 3
-    if result.gamechanger_detected:
-        score += 3
-    if result.gamechanger_evidence:
-        score += len(result.gamechanger_evidence)
-    if result.booking_link_followed:
-        score += 1
-    if result.errors:
-        score -= 1
+    score = (
+        (1 if csp_only else 3) * result.duetto_pixel_detected
+        + 3 * result.gamechanger_detected
+        + len(result.gamechanger_evidence)
+        + (result.booking_link_followed is not None)
+        - bool(result.errors)
+    )
 
     if csp_only:
-        return "medium" if score >= 2 else "low"
-
-    if score >= 4:
-        return "high"
-    elif score >= 2:
-        return "medium"
-    elif score >= 1:
-        return "low"
-    return "none"
+        return ("low", "medium")[score >= 2]
+
+    return _CONFIDENCE_LEVELS[bisect_right(_CONFIDENCE_THRESHOLDS, score)]
@@ -11,24 +11,32 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
+import re
+from functools import lru_cache
 
 from models import BookingLinkInfo
-from config import settings
+from detector.llm_json import loads_json_block
+from detector.rate_limiter import anthropic_limiter, firecrawl_limiter
 
 logger = logging.getLogger(__name__)
 
 
-def _map_brand_site(brand_url: str, hotel_name: str, limit: int = 20) -> list[dict]:
-    """Use Firecrawl map() to discover pages on a brand site (sync)."""
-    from firecrawl import Firecrawl
+@lru_cache(maxsize=256)
+def _map_brand_site(brand_url: str, hotel_name: str, limit: int = 20) -> tuple[dict, ...]:
+    """Use Firecrawl map() to discover pages on a brand site (sync).
 
-    app = Firecrawl(api_key=settings.firecrawl_api_key)
-    result = app.map(brand_url, search=hotel_name, limit=limit)
+    Memoized per (brand_url, hotel_name); treat the dicts as read-only.
+    """
+    from detector.api_clients import get_firecrawl
+
+    app = get_firecrawl()
+    with firecrawl_limiter.track():
+        result = app.map(brand_url, search=hotel_name, limit=limit)
 
     if not result or not result.links:
-        return []
+        return ()
 
-    return [
+    return tuple(
         {
             "url": link.url,
             "title": getattr(link, "title", None) or "",
@@ -36,57 +44,56 @@ def _map_brand_site(brand_url: str, hotel_name: str, limit: int = 20) -> list[di
         }
         for link in result.links
         if link.url
-    ]
+    )
+
+
+PROPERTY_PICK_SYSTEM = """You are looking for the specific property page for a hotel on its brand website.
+
+The user lists pages found on the brand site. Pick the URL that is the
+specific hotel/property page for the named hotel.
+This should be the property's detail/overview page, NOT a search results
+page, NOT the brand homepage, and NOT a generic listing.
 
+Return ONLY valid JSON: {"index": 1, "reason": "..."}
+If no page matches this specific property: {"index": 0, "reason": "..."}"""
 
-def _pick_property_page(
-    links: list[dict],
+
+async def _pick_property_page(
+    links: tuple[dict, ...],
     hotel_name: str,
     brand_url: str,
 ) -> str | None:
-    """Use Claude Haiku to select the property page from map results (sync)."""
-    from anthropic import Anthropic
+    """Use Claude Haiku to select the property page from map results."""
+    from detector.api_clients import get_async_anthropic
 
     if not links:
         return None
 
-    client = Anthropic(api_key=settings.anthropic_api_key)
+    client = get_async_anthropic()
 
     links_text = "\n".join(
         f'{i+1}. URL: {l["url"]}\n   Title: {l["title"]}\n   Description: {l["description"]}'
         for i, l in enumerate(links[:15])
     )
 
-    prompt = f"""You are looking for the specific property page for "{hotel_name}" on the brand website {brand_url}.
+    prompt = f"""Hotel: "{hotel_name}"
+Brand website: {brand_url}
 
 Here are pages found on the brand site:
-{links_text}
-
-Which URL is the specific hotel/property page for "{hotel_name}"?
-This should be the property's detail/overview page, NOT a search results
-page, NOT the brand homepage, and NOT a generic listing.
-
-Return ONLY valid JSON: {{"index": 1, "reason": "..."}}
-If no page matches this specific property: {{"index": 0, "reason": "..."}}"""
-
-    message = client.messages.create(
-        model="claude-haiku-4-5-20251001",
-        max_tokens=256,
-        messages=[{"role": "user", "content": prompt}],
-    )
+{links_text}"""
+
+    async with anthropic_limiter.track_async():
+        message = await client.messages.create(
+            model="claude-haiku-4-5-20251001",
+            max_tokens=256,
+            system=PROPERTY_PICK_SYSTEM,
+            messages=[{"role": "user", "content": prompt}],
+        )
 
     text = message.content[0].text.strip()
-    if "```" in text:
-        for part in text.split("```"):
-            part = part.strip()
-            if part.startswith("json"):
-                part = part[4:].strip()
-            if part.startswith("{"):
-                text = part
-                break
 
     try:
-        data = json.loads(text)
+        data = loads_json_block(text)
         idx = data.get("index", 0)
         if 1 <= idx <= len(links):
             return links[idx - 1]["url"]
@@ -96,22 +103,59 @@ If no page matches this specific property: {{"index": 0, "reason": "..."}}"""
     return None
 
 
+# Markdown headings (levels 1-3) that start a new section
+_SECTION_RE = re.compile(r"^(?=#{1,3} )", re.MULTILINE)
+# Sections that mention booking are always sent to the LLM
+_BOOKING_HINT_RE = re.compile(r"book|reserv|availab", re.IGNORECASE)
+
+MARKDOWN_BUDGET = 4000
+
+
+def _condense_markdown(markdown: str, budget: int = MARKDOWN_BUDGET) -> str:
+    """Cut page markdown down to about *budget* characters for the LLM.
+
+    Sections that mention booking are kept first; the rest of the budget
+    goes to the densest sections (characters per line), which passes over
+    link-list navigation and footers. Kept sections stay in page order.
+    """
+    if len(markdown) <= budget:
+        return markdown
+
+    sections = [s for s in _SECTION_RE.split(markdown) if s.strip()]
+
+    def priority(i: int) -> tuple[bool, float]:
+        text = sections[i]
+        density = len(text) / (1 + text.count("\n"))
+        return (not _BOOKING_HINT_RE.search(text), -density)
+
+    kept: list[int] = []
+    used = 0
+    for i in sorted(range(len(sections)), key=priority):
+        if used + len(sections[i]) <= budget:
+            kept.append(i)
+            used += len(sections[i])
+
+    if not kept:
+        return markdown[:budget] + "\n\n[content truncated]"
+    return "".join(sections[i] for i in sorted(kept)) + "\n\n[content truncated]"
+
+
 def _scrape_and_extract(page_url: str, hotel_name: str) -> list[dict]:
     """Scrape a property page and extract booking links via LLM (sync)."""
-    from firecrawl import Firecrawl
-    from anthropic import Anthropic
+    from detector.api_clients import get_anthropic, get_firecrawl
 
-    app = Firecrawl(api_key=settings.firecrawl_api_key)
-    doc = app.scrape(page_url, formats=["markdown"])
+    app = get_firecrawl()
+    with firecrawl_limiter.track():
+        doc = app.scrape(page_url, formats=["markdown"])
 
     if not doc or not doc.markdown:
         return []
 
-    markdown = doc.markdown
-    if len(markdown) > 8000:
-        markdown = markdown[:8000] + "\n\n[content truncated]"
+    markdown = _condense_markdown(doc.markdown)
+    # Don't hold the full page in memory for the length of the LLM call
+    del doc
 
-    client = Anthropic(api_key=settings.anthropic_api_key)
+    client = get_anthropic()
 
     prompt = f"""You are analyzing the property page for "{hotel_name}" to find booking engine links.
 
@@ -129,24 +173,17 @@ Return ONLY valid JSON:
 {{"links": [{{"url": "https://...", "text": "Book Now"}}]}}
 If no booking link found: {{"links": []}}"""
 
-    message = client.messages.create(
-        model="claude-haiku-4-5-20251001",
-        max_tokens=512,
-        messages=[{"role": "user", "content": prompt}],
-    )
+    with anthropic_limiter.track():
+        message = client.messages.create(
+            model="claude-haiku-4-5-20251001",
+            max_tokens=512,
+            messages=[{"role": "user", "content": prompt}],
+        )
 
     text = message.content[0].text.strip()
-    if "```" in text:
-        for part in text.split("```"):
-            part = part.strip()
-            if part.startswith("json"):
-                part = part[4:].strip()
-            if part.startswith("{"):
-                text = part
-                break
 
     try:
-        data = json.loads(text)
+        data = loads_json_block(text)
         return data.get("links", [])
     except json.JSONDecodeError:
         logger.warning("LLM brand crawl invalid JSON: %s", text[:200])
@@ -175,9 +212,7 @@ async def find_booking_links_brand_crawl(
 
     # Step 2: LLM picks the right property page
     try:
-        property_url = await asyncio.to_thread(
-            _pick_property_page, links, hotel_name, website_url
-        )
+        property_url = await _pick_property_page(links, hotel_name, website_url)
     except Exception as e:
         logger.warning("Brand crawl property pick failed: %s", e)
         return []
@@ -15,86 +15,64 @@ from detector.booking_engine_domains import extract_base_domain
 
 logger = logging.getLogger(__name__)
 
-# brand base-domain → list of provider info dicts
-CHAIN_BOOKING_PATTERNS: dict[str, list[dict]] = {
-    "hardrock.com": [
-        {
-            "provider": "SynXis",
-            "url_template": "https://be.synxis.com/?chain=28120",
-            "search_hint": "{hotel_name} Hard Rock Hotel book room synxis",
-        },
-    ],
-    "marriott.com": [
-        {
-            "provider": "Marriott IBE",
-            "url_template": "https://www.marriott.com/reservation/rateListMenu.mi",
-            "search_hint": "{hotel_name} marriott book room reservation",
-        },
-    ],
-    "hilton.com": [
-        {
-            "provider": "Hilton IBE",
-            "url_template": "https://www.hilton.com/en/book/reservation/rooms/",
-            "search_hint": "{hotel_name} hilton book room reservation",
-        },
-    ],
-    "ihg.com": [
-        {
-            "provider": "IHG IBE",
-            "url_template": "https://www.ihg.com/redirect",
-            "search_hint": "{hotel_name} IHG book room reservation",
-        },
-    ],
-    "hyatt.com": [
-        {
-            "provider": "Hyatt IBE",
-            "url_template": "https://www.hyatt.com/shop/rooms/",
-            "search_hint": "{hotel_name} hyatt book room reservation",
-        },
-    ],
-    "accor.com": [
-        {
-            "provider": "Accor IBE",
-            "url_template": "https://all.accor.com/",
-            "search_hint": "{hotel_name} accor book room reservation",
-        },
-    ],
-    "wyndhamhotels.com": [
-        {
-            "provider": "Wyndham IBE",
-            "url_template": "https://www.wyndhamhotels.com/",
-            "search_hint": "{hotel_name} wyndham book room reservation",
-        },
-    ],
-    "choicehotels.com": [
-        {
-            "provider": "Choice IBE",
-            "url_template": "https://www.choicehotels.com/",
-            "search_hint": "{hotel_name} choice hotels book room reservation",
-        },
-    ],
-    "radissonhotels.com": [
-        {
-            "provider": "Radisson IBE",
-            "url_template": "https://www.radissonhotels.com/",
-            "search_hint": "{hotel_name} radisson book room reservation",
-        },
-    ],
-    "bestwestern.com": [
-        {
-            "provider": "Best Western IBE",
-            "url_template": "https://www.bestwestern.com/",
-            "search_hint": "{hotel_name} best western book room reservation",
-        },
-    ],
+# brand base-domain → provider info
+CHAIN_BOOKING_PATTERNS: dict[str, dict] = {
+    "hardrock.com": {
+        "provider": "SynXis",
+        "url_template": "https://be.synxis.com/?chain=28120",
+        "search_hint": "{hotel_name} Hard Rock Hotel book room synxis",
+    },
+    "marriott.com": {
+        "provider": "Marriott IBE",
+        "url_template": "https://www.marriott.com/reservation/rateListMenu.mi",
+        "search_hint": "{hotel_name} marriott book room reservation",
+    },
+    "hilton.com": {
+        "provider": "Hilton IBE",
+        "url_template": "https://www.hilton.com/en/book/reservation/rooms/",
+        "search_hint": "{hotel_name} hilton book room reservation",
+    },
+    "ihg.com": {
+        "provider": "IHG IBE",
+        "url_template": "https://www.ihg.com/redirect",
+        "search_hint": "{hotel_name} IHG book room reservation",
+    },
+    "hyatt.com": {
+        "provider": "Hyatt IBE",
+        "url_template": "https://www.hyatt.com/shop/rooms/",
+        "search_hint": "{hotel_name} hyatt book room reservation",
+    },
+    "accor.com": {
+        "provider": "Accor IBE",
+        "url_template": "https://all.accor.com/",
+        "search_hint": "{hotel_name} accor book room reservation",
+    },
+    "wyndhamhotels.com": {
+        "provider": "Wyndham IBE",
+        "url_template": "https://www.wyndhamhotels.com/",
+        "search_hint": "{hotel_name} wyndham book room reservation",
+    },
+    "choicehotels.com": {
+        "provider": "Choice IBE",
+        "url_template": "https://www.choicehotels.com/",
+        "search_hint": "{hotel_name} choice hotels book room reservation",
+    },
+    "radissonhotels.com": {
+        "provider": "Radisson IBE",
+        "url_template": "https://www.radissonhotels.com/",
+        "search_hint": "{hotel_name} radisson book room reservation",
+    },
+    "bestwestern.com": {
+        "provider": "Best Western IBE",
+        "url_template": "https://www.bestwestern.com/",
+        "search_hint": "{hotel_name} best western book room reservation",
+    },
 }
 
 
 def get_chain_info(website_url: str) -> dict | None:
     """Look up chain booking info by the hotel's website domain."""
-    base = extract_base_domain(website_url)
-    entries = CHAIN_BOOKING_PATTERNS.get(base)
-    return entries[0] if entries else None
+    return CHAIN_BOOKING_PATTERNS.get(extract_base_domain(website_url))
 
 
 def get_search_hint(website_url: str, hotel_name: str) -> str | None:
@@ -11,21 +11,15 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
+from functools import lru_cache
 
 from models import BookingLinkInfo
 from config import settings
+from detector.llm_json import loads_json_block
+from detector.rate_limiter import anthropic_limiter, firecrawl_limiter
 
 logger = logging.getLogger(__name__)
 
-# OTAs and meta-search sites — NOT the hotel's own booking engine.
-OTA_DOMAINS = {
-    "booking.com", "expedia.com", "hotels.com", "kayak.com",
-    "tripadvisor.com", "agoda.com", "priceline.com", "trivago.com",
-    "hotwire.com", "orbitz.com", "travelocity.com", "trip.com",
-    "momondo.com", "skyscanner.com", "cheaptickets.com", "lastminute.com",
-    "hostelworld.com", "google.com",
-}
-
 
 def _build_search_queries(hotel_name: str, website_url: str) -> list[str]:
     """Build a prioritised list of search queries (max 2)."""
@@ -44,17 +38,23 @@ def _build_search_queries(hotel_name: str, website_url: str) -> list[str]:
     return queries
 
 
-def _search_firecrawl(query: str, limit: int = 5) -> list[dict]:
-    """Run a Firecrawl search (sync — called via asyncio.to_thread)."""
-    from firecrawl import Firecrawl
+@lru_cache(maxsize=1024)
+def _search_firecrawl(query: str, limit: int = 5) -> tuple[dict, ...]:
+    """Run a Firecrawl search (sync — called via asyncio.to_thread).
+
+    Results are memoized per query for the life of the process; treat the
+    returned dicts as read-only.
+    """
+    from detector.api_clients import get_firecrawl
 
-    app = Firecrawl(api_key=settings.firecrawl_api_key)
-    result = app.search(query, limit=limit)
+    app = get_firecrawl()
+    with firecrawl_limiter.track():
+        result = app.search(query, limit=limit)
 
     if not result or not result.web:
-        return []
+        return ()
 
-    return [
+    return tuple(
         {
             "url": item.url,
             "title": getattr(item, "title", None) or "",
@@ -62,53 +62,50 @@ def _search_firecrawl(query: str, limit: int = 5) -> list[dict]:
         }
         for item in result.web
         if hasattr(item, "url") and item.url
-    ]
+    )
+
+
+BEST_PICK_SYSTEM = """You are selecting the best booking engine URL for a hotel from web search results.
+
+Pick the result that is most likely to be the direct booking/reservation page
+where a guest can select dates and book a room at this specific hotel.
+Prefer URLs from known booking engine providers (SynXis, TravelClick,
+SiteMinder, etc.) over marketing pages.
+
+Return ONLY valid JSON: {"index": 1, "reason": "..."}
+If none are relevant: {"index": 0, "reason": "..."}"""
 
 
-def _pick_best_with_llm(candidates: list[dict], hotel_name: str) -> dict | None:
+async def _pick_best_with_llm(candidates: list[dict], hotel_name: str) -> dict | None:
     """Use Claude Haiku to pick the best booking engine URL from candidates."""
-    from anthropic import Anthropic
+    from detector.api_clients import get_async_anthropic
 
     if not candidates:
         return None
 
-    client = Anthropic(api_key=settings.anthropic_api_key)
+    client = get_async_anthropic()
     candidates_text = "\n".join(
         f'{i+1}. URL: {c["url"]}\n   Title: {c["title"]}\n   Description: {c["description"]}'
         for i, c in enumerate(candidates)
     )
 
-    prompt = f"""You are selecting the best booking engine URL for "{hotel_name}".
+    prompt = f"""Hotel: "{hotel_name}"
 
 Here are the search results:
-{candidates_text}
+{candidates_text}"""
 
-Pick the result that is most likely to be the direct booking/reservation page
-where a guest can select dates and book a room at this specific hotel.
-Prefer URLs from known booking engine providers (SynXis, TravelClick,
-SiteMinder, etc.) over marketing pages.
-
-Return ONLY valid JSON: {{"index": 1, "reason": "..."}}
-If none are relevant: {{"index": 0, "reason": "..."}}"""
-
-    message = client.messages.create(
-        model="claude-haiku-4-5-20251001",
-        max_tokens=256,
-        messages=[{"role": "user", "content": prompt}],
-    )
+    async with anthropic_limiter.track_async():
+        message = await client.messages.create(
+            model="claude-haiku-4-5-20251001",
+            max_tokens=256,
+            system=BEST_PICK_SYSTEM,
+            messages=[{"role": "user", "content": prompt}],
+        )
 
     text = message.content[0].text.strip()
-    if "```" in text:
-        for part in text.split("```"):
-            part = part.strip()
-            if part.startswith("json"):
-                part = part[4:].strip()
-            if part.startswith("{"):
-                text = part
-                break
 
     try:
-        data = json.loads(text)
+        data = loads_json_block(text)
         idx = data.get("index", 0)
         if 1 <= idx <= len(candidates):
             return candidates[idx - 1]
@@ -124,6 +121,7 @@ async def find_booking_links_web_search(
 ) -> list[BookingLinkInfo]:
     """Fallback 2: Search the web for the hotel's booking engine URL."""
     from detector.booking_engine_domains import (
+        OTA_DOMAINS,
         url_matches_booking_engine,
         extract_base_domain,
     )
@@ -131,34 +129,37 @@ async def find_booking_links_web_search(
     hotel_base = extract_base_domain(website_url)
     queries = _build_search_queries(hotel_name, website_url)
 
-    for query in queries:
-        logger.info("Web search: trying query '%s'", query)
+    # Run all queries at once, then take results in priority order
+    logger.info("Web search: trying queries %s", queries)
+    results = await asyncio.gather(
+        *(asyncio.to_thread(_search_firecrawl, query) for query in queries),
+        return_exceptions=True,
+    )
 
-        try:
-            raw_results = await asyncio.to_thread(_search_firecrawl, query)
-        except Exception as e:
-            logger.warning("Web search failed for '%s': %s", query, e)
+    for query, raw_results in zip(queries, results):
+        if isinstance(raw_results, Exception):
+            logger.warning("Web search failed for '%s': %s", query, raw_results)
             continue
 
         if not raw_results:
             logger.info("Web search: no results for '%s'", query)
             continue
 
-        # Tier 1: known booking engine domains, excluding hotel's own and OTAs
-        booking_candidates: list[dict] = []
+        # Drop the hotel's own site and OTAs once, for both tiers
+        external: list[dict] = []
         for r in raw_results:
             r_base = extract_base_domain(r["url"])
-            if r_base == hotel_base or r_base in OTA_DOMAINS:
-                continue
-            if url_matches_booking_engine(r["url"]):
-                booking_candidates.append(r)
+            if r_base != hotel_base and r_base not in OTA_DOMAINS:
+                external.append(r)
+
+        # Tier 1: known booking engine domains
+        booking_candidates = [
+            r for r in external if url_matches_booking_engine(r["url"])
+        ]
 
         # Tier 2: any external link with booking-related title/description
         if not booking_candidates:
-            for r in raw_results:
-                r_base = extract_base_domain(r["url"])
-                if r_base == hotel_base or r_base in OTA_DOMAINS:
-                    continue
+            for r in external:
                 combined = f"{r['title']} {r['description']}".lower()
                 if any(w in combined for w in ("book", "reserv", "room", "rate")):
                     booking_candidates.append(r)
@@ -167,14 +168,18 @@ async def find_booking_links_web_search(
             logger.info("Web search: no booking candidates for '%s'", query)
             continue
 
-        # Single candidate → use directly; multiple → LLM disambiguates
+        # Single candidate → use directly; one domain → shortest URL (most
+        # likely the engine's entry page); otherwise LLM disambiguates
+        candidate_bases = {
+            extract_base_domain(c["url"]) for c in booking_candidates
+        }
         if len(booking_candidates) == 1:
             best = booking_candidates[0]
+        elif len(candidate_bases) == 1:
+            best = min(booking_candidates, key=lambda c: len(c["url"]))
         elif settings.anthropic_api_key:
             try:
-                best = await asyncio.to_thread(
-                    _pick_best_with_llm, booking_candidates, hotel_name
-                )
+                best = await _pick_best_with_llm(booking_candidates, hotel_name)
             except Exception as e:
                 logger.warning("LLM pick failed: %s", e)
                 best = booking_candidates[0]
@@ -0,0 +1,32 @@
+"""Pull the JSON object out of an LLM reply.
+
+Models sometimes wrap their JSON in ```json fences or add a sentence
+before or after it; the object itself is everything from the first "{"
+to the last "}". Clean replies (the common case) are parsed directly.
+"""
+from __future__ import annotations
+
+import re
+
+import orjson
+
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def extract_json_block(text: str) -> str:
+    """Return the outermost {...} span of text, or text unchanged if none."""
+    match = _JSON_OBJECT_RE.search(text)
+    return match.group(0) if match else text
+
+
+def loads_json_block(text: str):
+    """Parse the JSON object in an LLM reply.
+
+    Raises orjson.JSONDecodeError (a json.JSONDecodeError) if there is none.
+    """
+    if text.startswith("{"):
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return orjson.loads(extract_json_block(text))
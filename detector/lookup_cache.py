@@ -0,0 +1,84 @@
+"""Persistent cache for paid lookup results (Perplexity, Firecrawl + Haiku).
+
+Values are stored as JSON in a small SQLite file, keyed by (namespace, key),
+and expire after lookup_cache_ttl_days (or a shorter per-entry TTL, used
+for answers that found nothing). The functions here are synchronous
+and meant to run inside the worker threads that already make the API calls.
+A cache failure is logged and treated as a miss — it never fails a lookup.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Any
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_initialized_path = ""
+
+
+def _connect() -> sqlite3.Connection:
+    global _initialized_path
+    path = settings.lookup_cache_path
+    if _initialized_path != path:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=5)
+    if _initialized_path != path:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS lookup_cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        _initialized_path = path
+    return conn
+
+
+def cache_get(namespace: str, key: str) -> Any | None:
+    """Return the cached value, or None if missing, expired, or bypassed."""
+    if settings.lookup_cache_bypass:
+        return None
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                "SELECT value FROM lookup_cache"
+                " WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, time.time()),
+            ).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning("Lookup cache read failed: %s", e)
+        return None
+    return json.loads(row[0]) if row else None
+
+
+def cache_set(
+    namespace: str, key: str, value: Any, ttl_seconds: float | None = None
+) -> None:
+    """Store a JSON-serializable value for ttl_seconds (default lookup_cache_ttl_days)."""
+    if ttl_seconds is None:
+        ttl_seconds = settings.lookup_cache_ttl_days * 86400
+    expires_at = time.time() + ttl_seconds
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO lookup_cache"
+                    " (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, json.dumps(value), expires_at),
+                )
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning("Lookup cache write failed: %s", e)
@@ -1,5 +1,21 @@
+import asyncio
+import re
 import time
+from collections import deque
+from dataclasses import dataclass
+
 from models import NetworkRequest
+from detector.booking_engine_domains import url_netloc
+
+
+@dataclass(slots=True)
+class CapturedRequest:
+    """One request seen by NetworkMonitor (slotted: scans log thousands)."""
+
+    url: str
+    method: str
+    resource_type: str
+    timestamp: float
 
 
 class NetworkMonitor:
@@ -17,6 +33,23 @@ class NetworkMonitor:
         "duettocloud.com",
     ]
 
+    # Single-pass matcher for the domain patterns (CSP headers, proof snippets)
+    DUETTO_DOMAIN_RE = re.compile(
+        "|".join(map(re.escape, DUETTO_DOMAIN_PATTERNS)), re.IGNORECASE
+    )
+
+    # Single-pass matchers for the pixel and GameChanger patterns, applied
+    # once per request at capture time
+    DUETTO_PIXEL_RE = re.compile(
+        "|".join(map(re.escape, DUETTO_PIXEL_PATTERNS)), re.IGNORECASE
+    )
+
+    # Console filters: Duetto mentions, minus CSP violation reports
+    DUETTO_CONSOLE_RE = re.compile("duetto", re.IGNORECASE)
+    CSP_VIOLATION_RE = re.compile(
+        "content security policy|violates", re.IGNORECASE
+    )
+
     GAMECHANGER_PATTERNS = [
         "gamechanger.duetto",
         "gc.duettoresearch.com",
@@ -24,30 +57,156 @@ class NetworkMonitor:
         "duettocloud.com/gamechanger",
     ]
 
+    GAMECHANGER_RE = re.compile(
+        "|".join(map(re.escape, GAMECHANGER_PATTERNS)), re.IGNORECASE
+    )
+
+    # Every pixel, domain and GameChanger pattern contains "duetto", so one
+    # scan for it rules out the vast majority of requests
+    DUETTO_ANY_RE = re.compile("duetto", re.IGNORECASE)
+
+    # Only the first messages end up on the result
+    MAX_CONSOLE_LOGS = 50
+    # Only the first few Duetto mentions are cited as evidence
+    MAX_DUETTO_CONSOLE_LOGS = 5
+    # Ad-heavy sites can fire thousands of requests; Duetto ones are kept
+    # separately at capture time, so only the general log is capped
+    MAX_REQUESTS = 2000
+
     def __init__(self):
-        self.all_requests: list[dict] = []
-        self.duetto_requests: list[dict] = []
+        # Most recent requests (competitor checks); hosts are kept for all
+        self.all_requests: deque[CapturedRequest] = deque(maxlen=self.MAX_REQUESTS)
+        self._domains: set[str] = set()
+        self.duetto_requests: list[CapturedRequest] = []
+        # Classified at capture time so the properties below are O(1)
+        self._pixel_entries: list[CapturedRequest] = []
+        self._gamechanger_count = 0
+        # First console messages, consecutive repeats collapsed
         self.console_logs: list[str] = []
+        self._last_console: str | None = None
+        # First console messages that reference Duetto directly (not CSP
+        # violations)
+        self.duetto_console_logs: list[str] = []
         self.csp_headers: list[str] = []
+        # Set on the first Duetto pixel request
+        self.pixel_seen = asyncio.Event()
+        # Requests to any Duetto or GameChanger URL so far; the event is
+        # set and replaced on each one, waking whoever is waiting
+        self._duetto_hits = 0
+        self._duetto_hit = asyncio.Event()
+        # Requests issued but not yet finished or failed, per page; Phase 1
+        # pages stay open while later phases load, so a context-wide count
+        # would never reach zero for the page being waited on
+        self._in_flight: dict[object, int] = {}
 
-    def attach(self, page):
-        """Attach listeners to a Playwright page."""
-        page.on("request", self._on_request)
-        page.on("response", self._on_response)
-        page.on("console", self._on_console)
+    def attach_context(self, context):
+        """Subscribe to request/response/console events for every page in a
+        Playwright browser context, including popups and new tabs."""
+        context.on("request", self._on_request)
+        context.on("response", self._on_response)
+        context.on("console", self._on_console)
+        context.on("requestfinished", self._on_request_done)
+        context.on("requestfailed", self._on_request_done)
+
+    def detach_context(self, context):
+        """Remove the listeners added by attach_context()."""
+        context.remove_listener("request", self._on_request)
+        context.remove_listener("response", self._on_response)
+        context.remove_listener("console", self._on_console)
+        context.remove_listener("requestfinished", self._on_request_done)
+        context.remove_listener("requestfailed", self._on_request_done)
 
     def _on_request(self, request):
-        entry = {
-            "url": request.url,
-            "method": request.method,
-            "resource_type": request.resource_type,
-            "timestamp": time.time(),
-        }
+        url = request.url
+        entry = CapturedRequest(
+            url, request.method, request.resource_type, time.time()
+        )
         self.all_requests.append(entry)
+        self._domains.add(url_netloc(url))
+        page = self._page_of(request)
+        self._in_flight[page] = self._in_flight.get(page, 0) + 1
 
-        url_lower = request.url.lower()
-        if any(p in url_lower for p in self.DUETTO_DOMAIN_PATTERNS):
+        # Classify once; the properties below read the tallies
+        if not self.DUETTO_ANY_RE.search(url):
+            return
+        is_gamechanger = self.GAMECHANGER_RE.search(url) is not None
+        if self.DUETTO_DOMAIN_RE.search(url):
             self.duetto_requests.append(entry)
+            self._note_duetto_hit()
+            if self.DUETTO_PIXEL_RE.search(url):
+                self._pixel_entries.append(entry)
+                self.pixel_seen.set()
+            if is_gamechanger:
+                self._gamechanger_count += 1
+        elif is_gamechanger:
+            self._note_duetto_hit()
+
+    @staticmethod
+    def _page_of(request):
+        """Return the page that issued *request*, or None (service workers)."""
+        try:
+            return request.frame.page
+        except Exception:
+            return None
+
+    def _on_request_done(self, request):
+        page = self._page_of(request)
+        count = self._in_flight.get(page, 0) - 1
+        if count > 0:
+            self._in_flight[page] = count
+        else:
+            self._in_flight.pop(page, None)
+
+    def in_flight_count(self, page) -> int:
+        """Return how many requests issued by *page* are still in flight."""
+        return self._in_flight.get(page, 0)
+
+    def _note_duetto_hit(self):
+        self._duetto_hits += 1
+        self._duetto_hit.set()
+        self._duetto_hit = asyncio.Event()
+
+    async def wait_for_duetto(self, timeout_ms: int) -> bool:
+        """Wait up to *timeout_ms* for a Duetto request issued after the call;
+        return whether one arrived.
+
+        Requests seen earlier in the scan don't count, so each navigation
+        gets its own chance to load the pixel.
+        """
+        start = self._duetto_hits
+        try:
+            await asyncio.wait_for(self._duetto_hit.wait(), timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            pass
+        return self._duetto_hits > start
+
+    async def wait_until_settled(self, page, max_ms: int, quiet_ms: int) -> bool:
+        """Wait up to *max_ms* for a Duetto pixel request or a quiet *page*.
+
+        Returns early once the pixel has been seen, or once *page* has had
+        no request in flight for *quiet_ms*; other pages in the context
+        don't count. Returns whether the pixel was seen.
+        """
+        deadline = time.monotonic() + max_ms / 1000
+        quiet = quiet_ms / 1000
+        quiet_since = None
+        while not self.pixel_seen.is_set():
+            now = time.monotonic()
+            if self.in_flight_count(page):
+                quiet_since = None
+            elif quiet_since is None:
+                quiet_since = now
+            if now >= deadline or (
+                quiet_since is not None and now - quiet_since >= quiet
+            ):
+                break
+            try:
+                await asyncio.wait_for(
+                    self.pixel_seen.wait(), min(0.25, deadline - now)
+                )
+            except asyncio.TimeoutError:
+                pass
+        return self.pixel_seen.is_set()
 
     def _on_response(self, response):
         """Capture CSP headers from document responses."""
@@ -61,52 +220,47 @@ class NetworkMonitor:
             pass
 
     def _on_console(self, msg):
-        self.console_logs.append(msg.text)
+        text = msg.text
+        # Apps that log in tight loops repeat the same line back to back
+        if text == self._last_console:
+            return
+        self._last_console = text
+        if len(self.console_logs) < self.MAX_CONSOLE_LOGS:
+            self.console_logs.append(text)
+        if (
+            len(self.duetto_console_logs) < self.MAX_DUETTO_CONSOLE_LOGS
+            and self.DUETTO_CONSOLE_RE.search(text)
+            and not self.CSP_VIOLATION_RE.search(text)
+        ):
+            self.duetto_console_logs.append(text)
 
     @property
     def duetto_pixel_detected(self) -> bool:
-        return any(
-            any(p in r["url"].lower() for p in self.DUETTO_PIXEL_PATTERNS)
-            for r in self.duetto_requests
-        )
+        return bool(self._pixel_entries)
 
     @property
     def gamechanger_in_network(self) -> bool:
-        return any(
-            any(p in r["url"].lower() for p in self.GAMECHANGER_PATTERNS)
-            for r in self.duetto_requests
-        )
+        return self._gamechanger_count > 0
 
     @property
     def pixel_requests(self) -> list[NetworkRequest]:
         return [
-            NetworkRequest(
-                url=r["url"],
-                method=r["method"],
-                resource_type=r.get("resource_type", ""),
-                timestamp=r.get("timestamp", 0),
+            # Fields are already typed at capture; skip re-validation
+            NetworkRequest.model_construct(
+                url=r.url,
+                method=r.method,
+                resource_type=r.resource_type,
+                timestamp=r.timestamp,
             )
-            for r in self.duetto_requests
-            if any(p in r["url"].lower() for p in self.DUETTO_PIXEL_PATTERNS)
+            for r in self._pixel_entries
         ]
 
     @property
     def duetto_in_csp(self) -> bool:
         """Check if any CSP header references Duetto domains."""
-        return any(
-            any(p in csp.lower() for p in self.DUETTO_DOMAIN_PATTERNS)
-            for csp in self.csp_headers
-        )
+        return any(self.DUETTO_DOMAIN_RE.search(csp) for csp in self.csp_headers)
 
     @property
     def captured_domains(self) -> list[str]:
         """Return unique domains from all captured requests."""
-        from urllib.parse import urlparse
-
-        domains = set()
-        for r in self.all_requests:
-            try:
-                domains.add(urlparse(r["url"]).netloc)
-            except Exception:
-                pass
-        return sorted(domains)
+        return sorted(self._domains - {""})
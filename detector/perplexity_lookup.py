@@ -11,21 +11,17 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
-from urllib.parse import urlparse
 
-import requests
+import orjson
 
 from config import settings
+from detector.booking_engine_domains import is_valid_non_ota_url
+from detector.llm_json import loads_json_block
+from detector.lookup_cache import cache_get, cache_set
+from detector.rate_limiter import perplexity_limiter, with_retries
 
 logger = logging.getLogger(__name__)
 
-OTA_DOMAINS = {
-    "booking.com", "expedia.com", "hotels.com", "kayak.com",
-    "tripadvisor.com", "agoda.com", "priceline.com", "trivago.com",
-    "hotwire.com", "orbitz.com", "travelocity.com", "trip.com",
-    "google.com", "momondo.com", "skyscanner.com",
-}
-
 PROMPT = """What is the official website and official direct booking URL for the hotel "{hotel_name}" in {city}?
 
 I need two URLs:
@@ -41,72 +37,60 @@ If you only know the website: {{"official_website": "https://...", "booking_url"
 If you don't know: {{"official_website": "", "booking_url": "", "confidence": "none"}}"""
 
 
-def _query_perplexity(hotel_name: str, city: str) -> dict:
-    """Synchronous Perplexity API call (run via asyncio.to_thread)."""
-    response = requests.post(
-        "https://api.perplexity.ai/chat/completions",
-        headers={
-            "Authorization": f"Bearer {settings.perplexity_api_key}",
-            "Content-Type": "application/json",
-        },
-        json={
-            "model": "sonar",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": PROMPT.format(hotel_name=hotel_name, city=city),
-                }
-            ],
-            "max_tokens": 300,
-            "temperature": 0.1,
-        },
-        timeout=15,
-    )
-    response.raise_for_status()
-    data = response.json()
+async def _query_perplexity(hotel_name: str, city: str) -> dict:
+    """Ask Perplexity over the shared HTTP/2 client.
 
-    text = data["choices"][0]["message"]["content"].strip()
+    Answers are cached persistently per normalized (hotel_name, city);
+    answers with no website (or no parseable JSON) for a few hours only.
+    """
+    from detector.api_clients import get_http_client
+
+    cache_key = f"{hotel_name.strip().lower()}|{city.strip().lower()}"
+    cached = await asyncio.to_thread(cache_get, "perplexity", cache_key)
+    if cached is not None:
+        return cached
+
+    client = get_http_client()
+
+    async def post():
+        async with perplexity_limiter.track_async():
+            response = await client.post(
+                "https://api.perplexity.ai/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {settings.perplexity_api_key}",
+                    "Content-Type": "application/json",
+                },
+                json={
+                    "model": "sonar",
+                    "messages": [
+                        {
+                            "role": "user",
+                            "content": PROMPT.format(hotel_name=hotel_name, city=city),
+                        }
+                    ],
+                    "max_tokens": 300,
+                    "temperature": 0.1,
+                },
+            )
+            response.raise_for_status()
+        return response
+
+    response = await with_retries(post)
+    data = orjson.loads(response.content)
 
-    # Handle code fences
-    if "```" in text:
-        for part in text.split("```"):
-            part = part.strip()
-            if part.startswith("json"):
-                part = part[4:].strip()
-            if part.startswith("{"):
-                text = part
-                break
-
-    # Handle text before/after JSON
-    start = text.find("{")
-    end = text.rfind("}") + 1
-    if start >= 0 and end > start:
-        text = text[start:end]
+    text = data["choices"][0]["message"]["content"].strip()
 
     try:
-        return json.loads(text)
+        data = loads_json_block(text)
     except json.JSONDecodeError:
         logger.warning("Perplexity lookup: invalid JSON: %s", text[:200])
-        return {}
-
+        data = {}
 
-def _validate_url(url: str) -> bool:
-    """Check that URL is valid and not an OTA."""
-    if not url or not url.startswith(("http://", "https://")):
-        return False
-    try:
-        parsed = urlparse(url)
-        if not parsed.netloc:
-            return False
-        base = parsed.netloc.lower().lstrip("www.")
-        parts = base.split(".")
-        if len(parts) >= 2:
-            registrable = ".".join(parts[-2:])
-            if registrable in OTA_DOMAINS:
-                return False
-        return True
-    except Exception:
-        return False
+    ttl = None
+    if not data.get("official_website"):
+        ttl = settings.lookup_cache_miss_ttl_hours * 3600
+    await asyncio.to_thread(cache_set, "perplexity", cache_key, data, ttl)
+    return data
 
 
 async def lookup_hotel_urls(
@@ -120,7 +104,7 @@ async def lookup_hotel_urls(
         return {"official_website": "", "booking_url": "", "confidence": "none"}
 
     try:
-        data = await asyncio.to_thread(_query_perplexity, hotel_name, city)
+        data = await _query_perplexity(hotel_name, city)
     except Exception as e:
         logger.warning("Perplexity lookup failed for %s: %s", hotel_name, e)
         return {"official_website": "", "booking_url": "", "confidence": "none"}
@@ -129,9 +113,9 @@ async def lookup_hotel_urls(
     booking = data.get("booking_url", "").strip()
     confidence = data.get("confidence", "none")
 
-    if not _validate_url(official):
+    if not is_valid_non_ota_url(official):
         official = ""
-    if not _validate_url(booking):
+    if not is_valid_non_ota_url(booking):
         booking = ""
 
     if confidence == "none" and not official:
@@ -0,0 +1,286 @@
+"""Client-side rate limiting for the paid APIs (Perplexity, Anthropic, Firecrawl).
+
+Each provider gets its own shared ProviderLimiter, so a slow or throttled
+provider never holds back calls to the others. A limiter caps requests per
+minute with a sliding window, and caps in-flight calls with an AIMD limit:
+the limit grows by ALPHA after each healthy call and shrinks by a factor of
+BETA after a 429, a call that got no response (timeout, connection error)
+or a call slower than the provider's target latency. A Retry-After header
+pauses new calls for that long. Calls run in worker threads and on the
+event loop, so the limiter state sits behind a threading.Condition; async
+callers wait on an asyncio.Event that release() and observe() set through
+call_soon_threadsafe, so no thread is parked per waiting coroutine.
+
+TokenBucket and HostPacer (asyncio-only) pace scan starts in the job and
+batch runners.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from config import settings
+from detector.booking_engine_domains import url_netloc
+
+ALPHA = 0.5
+BETA = 0.5
+WINDOW_SECONDS = 60.0
+
+# Statuses worth retrying: throttling and transient upstream failures
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+
+def _retry_after_seconds(headers) -> float:
+    """Parse a numeric Retry-After header; 0 if absent or not numeric."""
+    if not headers:
+        return 0.0
+    try:
+        return max(0.0, float(headers.get("retry-after", 0)))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ProviderLimiter:
+    """Sliding-window RPM cap plus AIMD concurrency limit for one provider."""
+
+    def __init__(
+        self,
+        rpm: int,
+        max_concurrent: int,
+        target_latency: float | None = None,
+    ):
+        self.rpm = rpm
+        self.max_concurrent = max_concurrent
+        self.target_latency = target_latency
+        self._limit = float(max_concurrent)
+        self._active = 0
+        self._sent: deque[float] = deque()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        # (loop, event) for each coroutine waiting in acquire_async()
+        self._async_waiters: set[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+    def _try_take(self) -> tuple[bool, float | None]:
+        """Reserve a slot if a call may start now (caller holds the lock).
+
+        Returns (True, None) once reserved, otherwise (False, timeout) where
+        timeout is how long to wait before retrying, or None to wait for a
+        notify.
+        """
+        now = time.monotonic()
+        while self._sent and now - self._sent[0] >= WINDOW_SECONDS:
+            self._sent.popleft()
+        if now < self._paused_until:
+            return False, self._paused_until - now
+        if self._active >= int(self._limit):
+            return False, None
+        if len(self._sent) >= self.rpm:
+            return False, WINDOW_SECONDS - (now - self._sent[0])
+        self._active += 1
+        self._sent.append(now)
+        return True, None
+
+    def _notify(self) -> None:
+        """Wake thread and coroutine waiters (caller holds the lock)."""
+        self._cond.notify_all()
+        for loop, event in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # loop already closed
+
+    def acquire(self) -> None:
+        """Block until a call may start, then reserve a slot for it."""
+        with self._cond:
+            while True:
+                taken, timeout = self._try_take()
+                if taken:
+                    return
+                self._cond.wait(timeout)
+
+    async def acquire_async(self) -> None:
+        """Wait on the event loop until a call may start, then reserve a
+        slot for it. Cancelling the wait never leaves a slot taken."""
+        loop = asyncio.get_running_loop()
+        while True:
+            waiter = (loop, asyncio.Event())
+            with self._cond:
+                taken, timeout = self._try_take()
+                if taken:
+                    return
+                self._async_waiters.add(waiter)
+            try:
+                await asyncio.wait_for(waiter[1].wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    self._async_waiters.discard(waiter)
+
+    def release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            self._notify()
+
+    def observe(self, status: int | None, headers=None, latency: float | None = None) -> None:
+        """Adjust the concurrency limit from a finished call's outcome."""
+        with self._cond:
+            retry_after = _retry_after_seconds(headers)
+            if status == 429 or retry_after:
+                self._limit = max(1.0, self._limit * BETA)
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + retry_after
+                )
+            elif status is None or (
+                self.target_latency is not None
+                and latency is not None
+                and latency > self.target_latency
+            ):
+                # No response at all is as much an overload signal as a 429
+                self._limit = max(1.0, self._limit * BETA)
+            elif status < 400:
+                self._limit = min(float(self.max_concurrent), self._limit + ALPHA)
+            self._notify()
+
+    @contextmanager
+    def track(self):
+        """Hold a slot around one synchronous API call and observe its result.
+
+        HTTP errors are read from the exception's ``response`` attribute
+        (httpx and the Anthropic SDK both set it).
+        """
+        self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            response = getattr(e, "response", None)
+            self.observe(
+                getattr(response, "status_code", None),
+                getattr(response, "headers", None),
+            )
+            raise
+        else:
+            self.observe(200, latency=time.monotonic() - start)
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def track_async(self):
+        """Async form of track(); waits for a slot without blocking the loop."""
+        await self.acquire_async()
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            response = getattr(e, "response", None)
+            self.observe(
+                getattr(response, "status_code", None),
+                getattr(response, "headers", None),
+            )
+            raise
+        else:
+            self.observe(200, latency=time.monotonic() - start)
+        finally:
+            self.release()
+
+
+async def with_retries(call, attempts: int = 3, base_delay: float = 1.0, max_delay: float = 30.0):
+    """Await call() and retry it on RETRY_STATUSES.
+
+    Waits with full-jitter exponential backoff between attempts, or for the
+    response's Retry-After if that is longer. Any other error, or the last
+    attempt's error, is raised.
+    """
+    for attempt in range(attempts):
+        try:
+            return await call()
+        except Exception as e:
+            response = getattr(e, "response", None)
+            status = getattr(response, "status_code", None)
+            if status not in RETRY_STATUSES or attempt == attempts - 1:
+                raise
+            backoff = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            retry_after = _retry_after_seconds(getattr(response, "headers", None))
+            await asyncio.sleep(max(backoff, min(retry_after, max_delay)))
+
+
+class TokenBucket:
+    """Async token bucket: *rate* acquisitions per second, bursting to *burst*.
+
+    A rate of 0 or less disables pacing.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated: float | None = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            if self._updated is not None:
+                elapsed = now - self._updated
+                self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                # Waiters queue on the lock, so tokens go out in arrival order
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._updated = loop.time()
+                self._tokens = 1.0
+            self._tokens -= 1
+
+    def idle_and_full(self) -> bool:
+        """Return True if nobody is waiting and the bucket has refilled, so
+        a fresh bucket would behave the same."""
+        if self._lock.locked():
+            return False
+        if self._updated is None:
+            return True
+        elapsed = asyncio.get_running_loop().time() - self._updated
+        return self._tokens + elapsed * self.rate >= self.burst
+
+
+class HostPacer:
+    """One TokenBucket per host, so scans of the same site are spaced out
+    without slowing scans of unrelated sites."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._buckets: dict[str, TokenBucket] = {}
+
+    async def acquire(self, url: str) -> None:
+        host = url_netloc(url).lower().removeprefix("www.")
+        if not host or self.rate <= 0:
+            return
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            # Forget hosts whose buckets have refilled, so a long-lived
+            # server only keeps buckets for hosts it is actively pacing
+            for stale in [h for h, b in self._buckets.items() if b.idle_and_full()]:
+                del self._buckets[stale]
+            bucket = self._buckets[host] = TokenBucket(self.rate)
+        await bucket.acquire()
+
+
+# Target latencies sit well above each provider's normal call time. Firecrawl
+# has none: its scrape and map times track the target site, not load on
+# Firecrawl.
+perplexity_limiter = ProviderLimiter(
+    settings.perplexity_rpm, settings.perplexity_concurrency, target_latency=20.0
+)
+anthropic_limiter = ProviderLimiter(
+    settings.anthropic_rpm, settings.anthropic_concurrency, target_latency=30.0
+)
+firecrawl_limiter = ProviderLimiter(
+    settings.firecrawl_rpm, settings.firecrawl_concurrency
+)
@@ -4,12 +4,21 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
+from operator import itemgetter
 
 from models import BookingLinkInfo
-from config import settings
+from detector.booking_engine_domains import url_netloc
+from detector.llm_json import loads_json_block
+from detector.lookup_cache import cache_get, cache_set
+from detector.rate_limiter import anthropic_limiter, firecrawl_limiter
 
 logger = logging.getLogger(__name__)
 
+# Markdown sent to Haiku is capped to keep costs low
+MARKDOWN_LIMIT = 8000
+
+CONFIDENCE_ORDER = {"high": 0, "medium": 1, "low": 2}
+
 PROMPT_TEMPLATE = """You are analyzing a hotel website to find the booking engine link.
 The hotel website URL is: {url}
 
@@ -32,105 +41,113 @@ If no booking link found: {{"links": []}}"""
 
 def _scrape_url(url: str) -> str | None:
     """Scrape a URL with Firecrawl and return markdown content."""
-    from firecrawl import Firecrawl
+    from detector.api_clients import get_firecrawl
 
-    app = Firecrawl(api_key=settings.firecrawl_api_key)
-    doc = app.scrape(url, formats=["markdown"])
+    app = get_firecrawl()
+    with firecrawl_limiter.track():
+        doc = app.scrape(url, formats=["markdown"])
 
     if not doc:
         return None
 
     markdown = doc.markdown or ""
+    del doc
     if not markdown:
         return None
 
-    # Truncate to keep Haiku costs low
-    if len(markdown) > 8000:
-        markdown = markdown[:8000] + "\n\n[content truncated]"
+    if len(markdown) > MARKDOWN_LIMIT:
+        markdown = markdown[:MARKDOWN_LIMIT] + "\n\n[content truncated]"
 
     return markdown
 
 
-def _ask_llm(markdown: str, url: str) -> list[dict]:
+async def _ask_llm(markdown: str, url: str) -> list[dict]:
     """Send page markdown to Claude Haiku to identify booking links."""
-    from anthropic import Anthropic
-
-    client = Anthropic(api_key=settings.anthropic_api_key)
-
-    message = client.messages.create(
-        model="claude-haiku-4-5-20251001",
-        max_tokens=1024,
-        messages=[
-            {
-                "role": "user",
-                "content": PROMPT_TEMPLATE.format(markdown=markdown, url=url),
-            }
-        ],
-    )
+    from detector.api_clients import get_async_anthropic
+
+    # The shared client's 10s timeout suits short prompts; 8000 chars of
+    # markdown with up to 1024 output tokens can run well past that
+    client = get_async_anthropic().with_options(timeout=60.0)
+
+    async with anthropic_limiter.track_async():
+        message = await client.messages.create(
+            model="claude-haiku-4-5-20251001",
+            max_tokens=1024,
+            messages=[
+                {
+                    "role": "user",
+                    "content": PROMPT_TEMPLATE.format(markdown=markdown, url=url),
+                }
+            ],
+        )
 
     text = message.content[0].text.strip()
 
-    # Parse JSON from response (handle markdown code fences)
-    if "```" in text:
-        # Extract content between code fences
-        parts = text.split("```")
-        for part in parts:
-            part = part.strip()
-            if part.startswith("json"):
-                part = part[4:].strip()
-            if part.startswith("{"):
-                text = part
-                break
-
     try:
-        data = json.loads(text)
+        data = loads_json_block(text)
         return data.get("links", [])
     except json.JSONDecodeError:
         logger.warning("LLM returned invalid JSON: %s", text[:200])
         return []
 
 
-async def find_booking_links_smart(url: str) -> list[BookingLinkInfo]:
-    """Use Firecrawl + Claude Haiku to find booking links on a hotel website."""
-    from urllib.parse import urlparse
+async def _find_links_data(url: str) -> list[dict]:
+    """Scrape *url* and ask the LLM for booking links.
+
+    The raw link dicts are cached persistently per normalized URL.
+    """
+    cache_key = url.rstrip("/").lower()
+    cached = await asyncio.to_thread(cache_get, "smart_links", cache_key)
+    if cached is not None:
+        return cached
 
-    # Run sync Firecrawl call in a thread
+    # Firecrawl's client is sync; run it in a thread
     markdown = await asyncio.to_thread(_scrape_url, url)
     if not markdown:
         logger.info("Firecrawl returned no content for %s", url)
         return []
 
-    # Run sync Anthropic call in a thread
-    links_data = await asyncio.to_thread(_ask_llm, markdown, url)
+    links_data = await _ask_llm(markdown, url)
+    # An empty answer may be a malformed reply; don't pin it for weeks
+    if links_data:
+        await asyncio.to_thread(cache_set, "smart_links", cache_key, links_data)
+    return links_data
+
+
+async def find_booking_links_smart(url: str) -> list[BookingLinkInfo]:
+    """Use Firecrawl + Claude Haiku to find booking links on a hotel website."""
+    links_data = await _find_links_data(url)
     if not links_data:
         return []
 
-    # Filter out links pointing back to the hotel's own domain
-    hotel_domain = urlparse(url).netloc.lower().lstrip("www.")
+    # Filter out links pointing back to the hotel's own domain, then sort
+    # the survivors by confidence (stable, so the LLM's order breaks ties)
+    hotel_domain = url_netloc(url).lower().removeprefix("www.")
 
-    confidence_order = {"high": 0, "medium": 1, "low": 2}
-    links_data.sort(key=lambda x: confidence_order.get(x.get("confidence", "low"), 2))
-
-    results = []
+    candidates = []
     for item in links_data:
         link_url = item.get("url", "").strip()
         if not link_url or not link_url.startswith("http"):
             continue
 
         # Skip same-domain links (not a booking engine)
-        link_domain = urlparse(link_url).netloc.lower().lstrip("www.")
+        link_domain = url_netloc(link_url).lower().removeprefix("www.")
         if link_domain == hotel_domain:
             logger.info("Skipping same-domain link: %s", link_url[:80])
             continue
 
-        results.append(
-            BookingLinkInfo(
-                text=item.get("text", "Book Now"),
-                href=link_url,
-                link_type="link",
-                detection_method="firecrawl_llm",
-                opens_in="new_tab",
-            )
-        )
+        rank = CONFIDENCE_ORDER.get(item.get("confidence", "low"), 2)
+        candidates.append((rank, link_url, item))
 
-    return results
+    candidates.sort(key=itemgetter(0))
+
+    return [
+        BookingLinkInfo(
+            text=item.get("text", "Book Now"),
+            href=link_url,
+            link_type="link",
+            detection_method="firecrawl_llm",
+            opens_in="new_tab",
+        )
+        for _, link_url, item in candidates
+    ]
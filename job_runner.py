@@ -8,6 +8,7 @@ from models import DuettoDetectionResult
 from config import settings
 from detector.browser_session import BrowserSession
 from detector.duetto_analyzer import analyze_hotel
+from detector.rate_limiter import HostPacer, TokenBucket
 import db
 
 logger = logging.getLogger(__name__)
@@ -15,32 +16,102 @@ logger = logging.getLogger(__name__)
 # Track running tasks so they aren't garbage-collected
 _tasks: dict[str, asyncio.Task] = {}
 
+# Seconds an SSE stream waits between DB reads when no update arrives
+# (or when the job isn't running in this process)
+UPDATE_WAIT_TIMEOUT = 15.0
+NOT_RUNNING_POLL_SECONDS = 2.0
+
+
+class _JobSignal:
+    """Wakes progress streams whenever a running job writes to the DB."""
+
+    def __init__(self):
+        self.version = 0
+        self._event = asyncio.Event()
+
+    def notify(self) -> None:
+        self.version += 1
+        self._event.set()
+        # Current waiters are already woken; later ones wait for the next update
+        self._event = asyncio.Event()
+
+    async def wait(self, seen_version: int, timeout: float) -> None:
+        if self.version != seen_version:
+            return
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+_signals: dict[str, _JobSignal] = {}
+
+
+def job_version(job_id: str) -> int:
+    """Return the job's update counter (0 if it isn't running here)."""
+    signal = _signals.get(job_id)
+    return signal.version if signal else 0
+
+
+async def wait_for_job_update(job_id: str, seen_version: int) -> None:
+    """Wait until the job writes something newer than *seen_version*.
+
+    Returns at once if it already has, and after UPDATE_WAIT_TIMEOUT at
+    most. Jobs not running in this process fall back to a short sleep.
+    """
+    signal = _signals.get(job_id)
+    if signal is None:
+        await asyncio.sleep(NOT_RUNNING_POLL_SECONDS)
+        return
+    await signal.wait(seen_version, UPDATE_WAIT_TIMEOUT)
+
 
 def launch_job(job_id: str, hotels: list[dict]) -> None:
     """Fire-and-forget a background scan job."""
     if job_id in _tasks:
         logger.warning("Job %s already running, ignoring duplicate launch", job_id)
         return
-    task = asyncio.create_task(_run_job(job_id, hotels))
+    signal = _signals[job_id] = _JobSignal()
+    task = asyncio.create_task(_run_job(job_id, hotels, signal))
     _tasks[job_id] = task
-    task.add_done_callback(lambda _: _tasks.pop(job_id, None))
 
+    def _finished(_):
+        _tasks.pop(job_id, None)
+        _signals.pop(job_id, None)
+        signal.notify()
+
+    task.add_done_callback(_finished)
 
-async def _run_job(job_id: str, hotels: list[dict]) -> None:
+
+async def _run_job(job_id: str, hotels: list[dict], signal: _JobSignal) -> None:
     """Run all hotel scans for a job, writing results to DB as they complete."""
     try:
         await db.mark_job_running(job_id)
         semaphore = asyncio.Semaphore(settings.max_concurrent_scans)
-
-        async with BrowserSession(headless=settings.headless) as browser:
+        # Paces scan starts; taken inside the semaphore so waiting tasks
+        # can't drain the bucket while the slots are full. The per-host
+        # pacer is taken before the semaphore, so hotels queued behind a
+        # busy host never hold a slot that an unrelated host could use.
+        pacer = TokenBucket(
+            settings.hotels_per_sec, burst=settings.max_concurrent_scans
+        )
+        host_pacer = HostPacer(settings.host_scans_per_sec)
+
+        async with BrowserSession(
+            headless=settings.headless,
+            max_contexts=settings.max_concurrent_scans,
+        ) as browser:
 
             async def scan_one(index: int, hotel: dict) -> None:
-                async with semaphore:
-                    name = hotel["name"]
-                    website = hotel["website"]
-                    city = hotel.get("city", "")
+                name = hotel["name"]
+                website = hotel["website"]
+                city = hotel.get("city", "")
 
+                await host_pacer.acquire(website)
+                async with semaphore:
+                    await pacer.acquire()
                     await db.update_hotel_status(job_id, index, "scanning")
+                    signal.notify()
 
                     try:
                         result = await analyze_hotel(
@@ -59,7 +130,8 @@ async def _run_job(job_id: str, hotels: list[dict]) -> None:
                         )
                     except Exception as e:
                         logger.error("Scan failed for %s: %s", name, e)
-                        error_result = DuettoDetectionResult(
+                        # Trusted inputs; model_construct still fills the defaults
+                        error_result = DuettoDetectionResult.model_construct(
                             hotel_name=name,
                             website_url=website,
                             errors=[str(e)],
@@ -67,8 +139,7 @@ async def _run_job(job_id: str, hotels: list[dict]) -> None:
                         await db.save_hotel_error(
                             job_id, index, error_result.model_dump_json()
                         )
-
-                    await asyncio.sleep(1.0)
+                    signal.notify()
 
             tasks = [scan_one(i, h) for i, h in enumerate(hotels)]
             await asyncio.gather(*tasks, return_exceptions=True)
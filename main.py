@@ -3,24 +3,29 @@ import json
 import uuid
 from contextlib import asynccontextmanager
 
+import orjson
 from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
 from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
 from models import BatchResult, DuettoDetectionResult
 from config import settings
-from pipeline.csv_processor import parse_csv, results_to_csv
+from pipeline.csv_processor import parse_csv, results_to_csv, with_scheme
 from detector.browser_session import BrowserSession
 from detector.duetto_analyzer import analyze_hotel
+from detector.api_clients import close_clients
 import db
-from job_runner import launch_job
+from job_runner import launch_job, job_version, wait_for_job_update
 
 
 @asynccontextmanager
 async def lifespan(app):
     await db.init_db()
     await db._recover_orphaned_jobs()
+    db.start_writer()
     yield
+    await db.stop_writer()
+    await close_clients()
 
 
 app = FastAPI(title="Duetto Detector", version="2.0.0", lifespan=lifespan)
@@ -40,8 +45,10 @@ async def dashboard(request: Request):
 @app.post("/scan")
 async def start_scan(csv_file: UploadFile = File(...)):
     """Upload CSV and start a background scan batch."""
-    content = await csv_file.read()
-    hotels = parse_csv(content)
+    # Parse straight from the spooled upload; stop once the batch is too big
+    hotels = await asyncio.to_thread(
+        parse_csv, csv_file.file, settings.max_hotels_per_batch + 1
+    )
 
     if not hotels:
         raise HTTPException(400, "No valid hotels found in CSV")
@@ -71,8 +78,7 @@ async def start_scan_url(
         raise HTTPException(400, "Hotel name is required")
     if not website and not city:
         raise HTTPException(400, "Provide either a website URL or a city (for AI lookup)")
-    if website and not website.startswith(("http://", "https://")):
-        website = f"https://{website}"
+    website = with_scheme(website)
 
     hotels = [{"name": name, "website": website, "city": city}]
     job_id = uuid.uuid4().hex[:12]
@@ -83,7 +89,7 @@ async def start_scan_url(
 
 @app.get("/stream/{job_id}")
 async def stream_progress(job_id: str):
-    """SSE endpoint that polls DB for scan progress."""
+    """SSE endpoint that streams scan progress as the job writes it."""
 
     async def event_generator():
         job = await db.get_job(job_id)
@@ -93,16 +99,29 @@ async def stream_progress(job_id: str):
 
         yield _sse({"type": "started", "total": job["total_hotels"]})
 
-        last_seen_done = 0
+        # Hotels finish out of order, so the cursor is the highest index below
+        # which every result has been sent; sent_done holds the ones above it.
+        last_seen_done = -1
+        sent_done: set[int] = set()
         sent_scanning: set[int] = set()
 
         while True:
+            # Read the counter before the DB so no update slips between them
+            version = job_version(job_id)
             job = await db.get_job(job_id)
-            hotels = await db.get_job_hotels(job_id)
+            scanning = await db.get_scanning_hotels(job_id)
+            done_hotels: list[dict] = []
+            cursor = last_seen_done
+            while True:
+                page = await db.get_job_hotels_since(job_id, cursor)
+                done_hotels.extend(page)
+                if len(page) < db.HOTEL_PAGE_SIZE:
+                    break
+                cursor = page[-1]["hotel_index"]
 
             # Yield events for in-progress hotels (only once per hotel)
-            for h in hotels:
-                if h["status"] == "scanning" and h["hotel_index"] not in sent_scanning:
+            for h in scanning:
+                if h["hotel_index"] not in sent_scanning:
                     sent_scanning.add(h["hotel_index"])
                     yield _sse({
                         "type": "scanning",
@@ -110,34 +129,31 @@ async def stream_progress(job_id: str):
                         "hotel": h["hotel_name"],
                     })
 
-            # Find completed hotels and yield results for new ones
-            done_hotels = [
-                h for h in hotels
-                if h["status"] in ("done", "error") and h["result_json"]
-            ]
-            done_hotels.sort(key=lambda h: h["hotel_index"])
-
-            for h in done_hotels[last_seen_done:]:
+            # Yield results for newly completed hotels
+            for h in done_hotels:
+                if h["hotel_index"] in sent_done:
+                    continue
+                sent_done.add(h["hotel_index"])
                 try:
-                    result = DuettoDetectionResult.model_validate_json(
-                        h["result_json"]
-                    )
+                    # Written by model_dump_json, so a plain parse is enough
+                    # for the handful of fields the progress view needs
+                    result = orjson.loads(h["result_json"])
                     yield _sse({
                         "type": "result",
                         "index": h["hotel_index"],
                         "hotel": h["hotel_name"],
-                        "duetto_pixel": result.duetto_pixel_detected,
-                        "gamechanger": result.gamechanger_detected,
-                        "products": [p.value for p in result.duetto_products],
-                        "confidence": result.confidence,
-                        "booking_engine_url": result.booking_engine_url,
-                        "booking_links_count": len(result.booking_links_found),
+                        "duetto_pixel": result["duetto_pixel_detected"],
+                        "gamechanger": result["gamechanger_detected"],
+                        "products": result["duetto_products"],
+                        "confidence": result["confidence"],
+                        "booking_engine_url": result["booking_engine_url"],
+                        "booking_links_count": len(result["booking_links_found"]),
                         "competitor_rms": [
-                            {"vendor": c.vendor, "category": c.category}
-                            for c in result.competitor_rms
+                            {"vendor": c["vendor"], "category": c["category"]}
+                            for c in result["competitor_rms"]
                         ],
-                        "scan_duration": result.scan_duration_seconds,
-                        "errors": result.errors,
+                        "scan_duration": result["scan_duration_seconds"],
+                        "errors": result["errors"],
                     })
                 except Exception:
                     yield _sse({
@@ -155,7 +171,9 @@ async def stream_progress(job_id: str):
                         "errors": ["Failed to parse result"],
                     })
 
-            last_seen_done = len(done_hotels)
+            while last_seen_done + 1 in sent_done:
+                last_seen_done += 1
+                sent_done.discard(last_seen_done)
 
             # Check if job is complete
             if job and job["status"] in ("done", "failed"):
@@ -171,7 +189,7 @@ async def stream_progress(job_id: str):
                 })
                 return
 
-            await asyncio.sleep(2)
+            await wait_for_job_update(job_id, version)
 
     return StreamingResponse(
         event_generator(), media_type="text/event-stream"
@@ -179,8 +197,8 @@ async def stream_progress(job_id: str):
 
 
 @app.get("/download/{job_id}")
-async def download_csv(job_id: str):
-    """Download results as CSV."""
+async def download_csv(job_id: str, json_cells: bool = False):
+    """Download results as CSV (list columns as JSON arrays with ?json_cells=1)."""
     job = await db.get_job(job_id)
     if not job:
         raise HTTPException(404, "Job not found")
@@ -199,7 +217,7 @@ async def download_csv(job_id: str):
         results=results,
     )
 
-    csv_content = results_to_csv(batch)
+    csv_content = results_to_csv(batch, json_cells=json_cells)
     return Response(
         content=csv_content,
         media_type="text/csv",
@@ -229,10 +247,9 @@ async def api_get_job(job_id: str):
 @app.get("/api/scan")
 async def api_scan_single(name: str, website: str, city: str = ""):
     """Scan a single hotel and return JSON (synchronous for API use)."""
-    if not website.startswith(("http://", "https://")):
-        website = f"https://{website}"
+    website = with_scheme(website)
 
-    async with BrowserSession(headless=settings.headless) as browser:
+    async with BrowserSession(headless=settings.headless, max_contexts=1) as browser:
         result = await analyze_hotel(name, website, browser, city=city)
     return result.model_dump()
 
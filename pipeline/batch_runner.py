@@ -7,6 +7,7 @@ from models import BatchResult, DuettoDetectionResult
 from config import settings
 from detector.browser_session import BrowserSession
 from detector.duetto_analyzer import analyze_hotel
+from detector.rate_limiter import HostPacer, TokenBucket
 
 
 async def run_batch(
@@ -14,55 +15,73 @@ async def run_batch(
     max_concurrent: int | None = None,
     screenshot_dir: str | None = None,
     on_progress: Callable | None = None,
+    on_result: Callable[[int, DuettoDetectionResult], None] | None = None,
+    keep_results: bool = True,
 ) -> BatchResult:
-    """Process a batch of hotels with controlled concurrency."""
+    """Process a batch of hotels with controlled concurrency.
+
+    *on_result* is called as each hotel finishes (in completion order), so
+    callers can stream results out; with keep_results=False the returned
+    BatchResult carries only the counts.
+    """
     max_concurrent = max_concurrent or settings.max_concurrent_scans
+    pacer = TokenBucket(settings.hotels_per_sec, burst=max_concurrent)
+    host_pacer = HostPacer(settings.host_scans_per_sec)
+    # Filled in by index, so results keep the input order
+    results: list[DuettoDetectionResult | None] = [None] * len(hotels)
+    counts = {"scanned": 0, "pixel": 0, "gamechanger": 0, "competitor": 0}
     semaphore = asyncio.Semaphore(max_concurrent)
 
-    async with BrowserSession(headless=settings.headless) as browser:
+    async with BrowserSession(
+        headless=settings.headless,
+        max_contexts=max_concurrent,
+        block_media=not screenshot_dir,
+    ) as browser:
 
-        async def scan_one(index: int, hotel: dict) -> DuettoDetectionResult:
+        async def scan_one(index: int, hotel: dict) -> None:
+            # Host pacing comes before the semaphore, so hotels queued behind
+            # a busy host never hold a slot an unrelated host could use
+            await host_pacer.acquire(hotel["website"])
             async with semaphore:
+                await pacer.acquire()
                 if on_progress:
                     on_progress(index, hotel["name"], "scanning")
 
-                result = await analyze_hotel(
-                    hotel_name=hotel["name"],
-                    website_url=hotel["website"],
-                    browser_session=browser,
-                    screenshot_dir=screenshot_dir,
-                    city=hotel.get("city", ""),
-                )
+                try:
+                    result = await analyze_hotel(
+                        hotel_name=hotel["name"],
+                        website_url=hotel["website"],
+                        browser_session=browser,
+                        screenshot_dir=screenshot_dir,
+                        city=hotel.get("city", ""),
+                    )
+                except Exception as e:
+                    # Trusted inputs; model_construct still fills the defaults
+                    result = DuettoDetectionResult.model_construct(
+                        hotel_name=hotel["name"],
+                        website_url=hotel["website"],
+                        errors=[str(e)],
+                    )
+
+                counts["scanned"] += 1
+                counts["pixel"] += result.duetto_pixel_detected
+                counts["gamechanger"] += result.gamechanger_detected
+                counts["competitor"] += bool(result.competitor_rms)
+                if keep_results:
+                    results[index] = result
+                if on_result:
+                    on_result(index, result)
 
                 if on_progress:
                     on_progress(index, hotel["name"], "done")
 
-                # Respectful delay between scans
-                await asyncio.sleep(1.0)
-                return result
-
-        tasks = [scan_one(i, h) for i, h in enumerate(hotels)]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-
-    final_results = []
-    for i, r in enumerate(results):
-        if isinstance(r, Exception):
-            final_results.append(DuettoDetectionResult(
-                hotel_name=hotels[i]["name"],
-                website_url=hotels[i]["website"],
-                errors=[str(r)],
-            ))
-        else:
-            final_results.append(r)
+        await asyncio.gather(*(scan_one(i, h) for i, h in enumerate(hotels)))
 
     return BatchResult(
         total_hotels=len(hotels),
-        scanned=len(final_results),
-        duetto_pixel_count=sum(
-            1 for r in final_results if r.duetto_pixel_detected
-        ),
-        gamechanger_count=sum(
-            1 for r in final_results if r.gamechanger_detected
-        ),
-        results=final_results,
+        scanned=counts["scanned"],
+        duetto_pixel_count=counts["pixel"],
+        gamechanger_count=counts["gamechanger"],
+        competitor_rms_count=counts["competitor"],
+        results=[r for r in results if r is not None],
     )
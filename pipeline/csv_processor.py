@@ -2,96 +2,211 @@ from __future__ import annotations
 
 import csv
 import io
+import re
+from functools import lru_cache
+from itertools import islice
+from operator import attrgetter
+from typing import IO, Callable, Iterator
 
-from models import BatchResult
+import orjson
 
+from models import BatchResult, DuettoDetectionResult
+from config import settings
 
-NAME_ALIASES = [
+
+NAME_ALIASES = (
     "name", "hotel_name", "hotel name", "account name", "property",
     "property name", "hotel",
-]
-WEBSITE_ALIASES = [
+)
+WEBSITE_ALIASES = (
     "website", "url", "website url", "site", "hotel url", "web",
     "homepage", "link",
-]
-CITY_ALIASES = [
+)
+CITY_ALIASES = (
     "city", "location", "city/location", "destination", "town",
     "hotel city", "property city",
-]
+)
+
+# Case-insensitive, so "HTTP://x.com" isn't turned into "https://HTTP://x.com"
+_SCHEME_RE = re.compile(r"https?://", re.IGNORECASE)
+
+
+@lru_cache(maxsize=128)
+def _column_positions(header: tuple[str, ...]) -> dict[str, int]:
+    """Map each header name to its first index (shared by all alias lookups)."""
+    positions: dict[str, int] = {}
+    for i, name in enumerate(header):
+        positions.setdefault(name, i)
+    return positions
 
 
-def _find_column(fieldnames: list[str], aliases: list[str]) -> str | None:
-    """Find the first matching column name from a list of aliases."""
+def with_scheme(website: str) -> str:
+    """Prefix https:// unless *website* is empty or already has an http(s) scheme."""
+    if website and not _SCHEME_RE.match(website):
+        return f"https://{website}"
+    return website
+
+
+@lru_cache(maxsize=128)
+def _find_column(header: tuple[str, ...], aliases: tuple[str, ...]) -> int | None:
+    """Find the index of the first matching column from a list of aliases."""
+    positions = _column_positions(header)
     for alias in aliases:
-        if alias in fieldnames:
-            return alias
+        if alias in positions:
+            return positions[alias]
     return None
 
 
-def parse_csv(content: str | bytes) -> list[dict]:
-    """Parse CSV with flexible column names. Returns list of dicts."""
-    if isinstance(content, bytes):
-        content = content.decode("utf-8-sig")  # Handle BOM
+def _cell(row: list[str], index: int | None) -> str:
+    if index is None or index >= len(row):
+        return ""
+    return row[index].strip()
+
 
-    reader = csv.DictReader(io.StringIO(content))
+def iter_hotels(stream: IO[bytes]) -> Iterator[dict]:
+    """Yield hotel dicts from a binary CSV stream, one row at a time."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")  # Handle BOM
+    try:
+        yield from _hotels_from_text(text)
+    finally:
+        # Leave the caller's stream open
+        text.detach()
 
-    if reader.fieldnames:
-        reader.fieldnames = [f.strip().lower() for f in reader.fieldnames]
 
-    name_col = _find_column(reader.fieldnames or [], NAME_ALIASES)
-    website_col = _find_column(reader.fieldnames or [], WEBSITE_ALIASES)
-    city_col = _find_column(reader.fieldnames or [], CITY_ALIASES)
+def parse_csv(
+    content: str | bytes | IO[bytes], limit: int | None = None
+) -> list[dict]:
+    """Parse CSV with flexible column names. Returns list of dicts.
+
+    With *limit*, reading stops after that many hotels.
+    """
+    if isinstance(content, str):
+        hotels = _hotels_from_text(io.StringIO(content))
+    else:
+        if isinstance(content, bytes):
+            content = io.BytesIO(content)
+        hotels = iter_hotels(content)
+    return list(islice(hotels, limit))
+
+
+def parse_csv_file(path: str, limit: int | None = None) -> list[dict]:
+    """Parse a CSV file from disk, read through a settings-sized buffer."""
+    with open(path, "rb", buffering=settings.csv_read_buffer_bytes) as f:
+        return parse_csv(f, limit)
+
+
+def _hotels_from_text(text: IO[str]) -> Iterator[dict]:
+    reader = csv.reader(text)
+
+    header = tuple(f.strip().lower() for f in next(reader, []))
+    name_idx = _find_column(header, NAME_ALIASES)
+    website_idx = _find_column(header, WEBSITE_ALIASES)
+    city_idx = _find_column(header, CITY_ALIASES)
 
-    hotels = []
     for row in reader:
-        name = row.get(name_col or "name", "").strip()
-        website = row.get(website_col or "website", "").strip()
-        city = row.get(city_col or "city", "").strip() if city_col else ""
+        name = _cell(row, name_idx)
         if not name:
             continue
         # Website is optional — Perplexity will find it if city is provided
-        if website and not website.startswith(("http://", "https://")):
-            website = f"https://{website}"
-        hotels.append({"name": name, "website": website, "city": city})
-
-    return hotels
-
-
-def results_to_csv(batch: BatchResult) -> str:
-    """Convert batch results to CSV string."""
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow([
-        "hotel_name",
-        "website_url",
-        "duetto_pixel_detected",
-        "gamechanger_detected",
-        "duetto_products",
-        "confidence",
-        "booking_engine_url",
-        "booking_links_count",
-        "pixel_request_urls",
-        "proof_snippets",
-        "competitor_rms",
-        "scan_duration_seconds",
-        "errors",
-    ])
-
-    for r in batch.results:
-        writer.writerow([
-            r.hotel_name,
-            r.website_url,
-            r.duetto_pixel_detected,
-            r.gamechanger_detected,
-            "; ".join(p.value for p in r.duetto_products),
-            r.confidence,
-            r.booking_engine_url,
-            len(r.booking_links_found),
-            "; ".join(pr.url for pr in r.pixel_requests),
-            " | ".join(r.proof_snippets) if r.proof_snippets else "",
-            "; ".join(f"{c.vendor} ({c.category})" for c in r.competitor_rms) if r.competitor_rms else "",
-            f"{r.scan_duration_seconds:.1f}",
-            "; ".join(r.errors) if r.errors else "",
-        ])
-
+        website = with_scheme(_cell(row, website_idx))
+        city = _cell(row, city_idx)
+        yield {"name": name, "website": website, "city": city}
+
+
+# Output dialect for result CSVs: minimal quoting, "\n" line endings
+csv.register_dialect(
+    "duetto_results",
+    delimiter=",",
+    quoting=csv.QUOTE_MINIMAL,
+    lineterminator="\n",
+)
+
+CSV_HEADER = (
+    "hotel_name",
+    "website_url",
+    "duetto_pixel_detected",
+    "gamechanger_detected",
+    "duetto_products",
+    "confidence",
+    "booking_engine_url",
+    "booking_links_count",
+    "pixel_request_urls",
+    "proof_snippets",
+    "competitor_rms",
+    "scan_duration_seconds",
+    "errors",
+)
+
+
+def _list_cell(items: list[str], sep: str, json_cells: bool) -> str:
+    return orjson.dumps(items).decode() if json_cells else sep.join(items)
+
+
+# Every attribute a CSV row reads, fetched in one C-level call per result
+_row_fields = attrgetter(
+    "hotel_name",
+    "website_url",
+    "duetto_pixel_detected",
+    "gamechanger_detected",
+    "duetto_products",
+    "confidence",
+    "booking_engine_url",
+    "booking_links_found",
+    "pixel_requests",
+    "proof_snippets",
+    "competitor_rms",
+    "scan_duration_seconds",
+    "errors",
+)
+
+
+def _result_row(r: DuettoDetectionResult, json_cells: bool = False) -> tuple:
+    (
+        name, website, pixel, gamechanger, products, confidence, engine_url,
+        links, pixel_requests, snippets, competitors, duration, errors,
+    ) = _row_fields(r)
+    # join() builds a list from a generator anyway; list comps skip the frame
+    return (
+        name,
+        website,
+        pixel,
+        gamechanger,
+        # DuettoProduct is a str Enum: members join (and encode) as their values
+        _list_cell(products, "; ", json_cells),
+        confidence,
+        engine_url,
+        len(links),
+        _list_cell([pr.url for pr in pixel_requests], "; ", json_cells),
+        _list_cell(snippets, " | ", json_cells),
+        _list_cell(
+            [f"{c.vendor} ({c.category})" for c in competitors], "; ", json_cells
+        ),
+        f"{duration:.1f}",
+        _list_cell(errors, "; ", json_cells),
+    )
+
+
+def open_results_csv(
+    f: IO[str], json_cells: bool = False
+) -> Callable[[DuettoDetectionResult], None]:
+    """Write the CSV header to *f*; return a function that appends one result."""
+    writer = csv.writer(f, dialect="duetto_results")
+    writer.writerow(CSV_HEADER)
+
+    def write(r: DuettoDetectionResult) -> None:
+        writer.writerow(_result_row(r, json_cells))
+
+    return write
+
+
+def results_to_csv(batch: BatchResult, json_cells: bool = False) -> str:
+    """Convert batch results to CSV string.
+
+    List columns are "; "-joined by default; with *json_cells* they are JSON
+    arrays instead, which round-trip even when items contain the separator.
+    """
+    output = io.StringIO(newline="")
+    writer = csv.writer(output, dialect="duetto_results")
+    writer.writerow(CSV_HEADER)
+    writer.writerows(_result_row(r, json_cells) for r in batch.results)
     return output.getvalue()